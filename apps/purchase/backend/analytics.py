@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from database import db
+from models import Provider, CatalogItem, Purchase, PurchaseLine
+
+# Set-based analysis queries. Each function answers with ONE statement
+# (no per-item / per-provider lookups), so cost does not grow with round trips.
+
+# SQLite bound-parameter limit is 999 on older builds
+IN_CHUNK = 900
+
+def _chunks(ids, size=IN_CHUNK):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def latest_price_rows(item_ids=None):
+    """
+    Latest unit cost per (item, provider):
+    ROW_NUMBER() OVER (PARTITION BY item, provider ORDER BY purchase date DESC).
+    item_ids=None means the whole catalog.
+    Returns row tuples (item_id, provider_id, provider_name, unit_cost, date).
+    """
+    if item_ids is None:
+        return _latest_price_query(None)
+
+    rows = []
+    for chunk in _chunks(item_ids):
+        rows.extend(_latest_price_query(chunk))
+    return rows
+
+def _latest_price_query(item_ids):
+    ranked = select(
+        PurchaseLine.catalog_item_id.label('item_id'),
+        Purchase.provider_id.label('provider_id'),
+        PurchaseLine.unit_cost.label('unit_cost'),
+        Purchase.date.label('date'),
+        func.row_number().over(
+            partition_by=(PurchaseLine.catalog_item_id, Purchase.provider_id),
+            order_by=(Purchase.date.desc(), Purchase.id.desc())
+        ).label('rn')
+    ).join(Purchase, PurchaseLine.purchase_id == Purchase.id)
+
+    if item_ids is not None:
+        ranked = ranked.where(PurchaseLine.catalog_item_id.in_(item_ids))
+    ranked = ranked.subquery()
+
+    stmt = select(
+        ranked.c.item_id, ranked.c.provider_id, Provider.name, ranked.c.unit_cost, ranked.c.date
+    ).join(Provider, Provider.id == ranked.c.provider_id).\
+        where(ranked.c.rn == 1).\
+        order_by(ranked.c.item_id, ranked.c.unit_cost)
+
+    return db.session.execute(stmt).all()
+
+def latest_prices_by_item(item_ids=None):
+    # { item_id: [ {provider_id, name, last_price, date}, ... ] } cheapest first
+    result = {}
+    for item_id, provider_id, provider_name, unit_cost, date in latest_price_rows(item_ids):
+        result.setdefault(item_id, []).append({
+            "provider_id": provider_id,
+            "name": provider_name,
+            "last_price": unit_cost,
+            "date": date.isoformat() if date else None
+        })
+    return result
+
+# --- Rankings (purchase screens) ---
+# Confirmed purchases only, optional time window, ranked by purchase count or spend.
+
+WINDOWS = {'30': 30, '90': 90, '365': 365, 'all': None} # query arg -> days
+RANK_BY = ('count', 'spend')
+
+def parse_ranking_args(args):
+    """(?window=30|90|365|all, ?rank=count|spend) -> (window_days, rank_by). Raises ValueError."""
+    window = args.get('window', 'all')
+    rank_by = args.get('rank', 'count')
+    if window not in WINDOWS:
+        raise ValueError(f"Invalid window '{window}'. Options: {', '.join(WINDOWS)}")
+    if rank_by not in RANK_BY:
+        raise ValueError(f"Invalid rank '{rank_by}'. Options: {', '.join(RANK_BY)}")
+    return WINDOWS[window], rank_by
+
+def _confirmed_since(window_days):
+    criteria = [Purchase.status == 'confirmed']
+    if window_days:
+        criteria.append(Purchase.date >= datetime.utcnow() - timedelta(days=window_days))
+    return criteria
+
+def top_providers(window_days=None, rank_by='count', limit=6):
+    """Returns [(Provider, purchase_count, spend)] in ranking order, one statement."""
+    purchase_count = func.count(Purchase.id).label('purchase_count')
+    spend = func.coalesce(func.sum(Purchase.total_amount), 0.0).label('spend')
+    ranked = select(Purchase.provider_id, purchase_count, spend).\
+        where(*_confirmed_since(window_days)).\
+        group_by(Purchase.provider_id).\
+        subquery()
+
+    metric = ranked.c.spend if rank_by == 'spend' else ranked.c.purchase_count
+    stmt = select(Provider, ranked.c.purchase_count, ranked.c.spend).\
+        join(ranked, ranked.c.provider_id == Provider.id).\
+        order_by(metric.desc(), Provider.name).\
+        limit(limit)
+    return db.session.execute(stmt).all()
+
+def provider_top_items(provider_id, window_days=None, rank_by='count', limit=8):
+    """Returns [(item_id, name, sku, current_cost, line_count, spend)] in ranking order, one statement."""
+    line_count = func.count(PurchaseLine.id).label('line_count')
+    spend = func.coalesce(func.sum(PurchaseLine.total_cost), 0.0).label('spend')
+    metric = spend if rank_by == 'spend' else line_count
+
+    stmt = select(
+        CatalogItem.id, CatalogItem.name, CatalogItem.sku, CatalogItem.current_cost, line_count, spend
+    ).select_from(PurchaseLine).\
+        join(Purchase, PurchaseLine.purchase_id == Purchase.id).\
+        join(CatalogItem, PurchaseLine.catalog_item_id == CatalogItem.id).\
+        where(Purchase.provider_id == provider_id, *_confirmed_since(window_days)).\
+        group_by(CatalogItem.id).\
+        order_by(metric.desc(), CatalogItem.name).\
+        limit(limit)
+    return db.session.execute(stmt).all()
@@ -0,0 +1,166 @@
+import numpy as np
+from extensions import catalog
+from price_series import get_store
+
+# Price anomaly scoring for the review screen.
+#
+# Constant work per invoice, whatever its size: the catalog entries of its items come
+# from the in-process read model (catalog_cache.py, no query in steady state); the
+# price history (last HISTORY_POINTS confirmed unit costs per item) comes from the
+# memory-mapped price series (price_series.py), not from the lines table.
+# Scoring is vectorized with NumPy:
+# - reference = median of the (item, provider) history when it has MIN_POINTS,
+#   else of the item history across providers, else current_cost;
+# - robust z = 0.6745 * (x - median) / MAD (falls back to relative deviation when
+#   the history is flat, MAD = 0);
+# - unit heuristics: price off by a large factor (kg vs und, box vs unit) and
+#   quantities that look like grams on by-weight items.
+#
+# Each line gets a severity: none < info < warning < critical, plus reasons.
+
+HISTORY_POINTS = 60
+MIN_POINTS = 4
+Z_WARNING = 2.5
+Z_CRITICAL = 3.5
+MIN_REL_DEVIATION = 0.05 # below 5% nothing is an anomaly, however tight the history
+FLAT_WARNING = 0.15 # relative deviation thresholds when MAD == 0 / no history
+FLAT_CRITICAL = 0.50
+UNIT_FACTOR = 8.0 # price ratio that suggests a different unit
+GRAMS_QTY = 200 # by-weight quantity that looks like grams
+
+SEVERITIES = ('none', 'info', 'warning', 'critical')
+
+def _history(series_dir, item_ids, exclude_purchase_id):
+    """Arrays (item, provider, cost) of the last HISTORY_POINTS confirmed points per item."""
+    points = get_store(series_dir).items_points(item_ids)
+    points = points[(points['purchase'] != exclude_purchase_id) & (points['cost'] > 0)]
+    if not len(points):
+        return None
+    item, ts = points['item'].astype(np.int64), points['ts']
+    order = np.lexsort((ts, item))
+    item, provider, cost = item[order], points['provider'][order].astype(np.int64), points['cost'][order]
+    # position from the end of each item's run; keep the newest HISTORY_POINTS
+    _, start, count = np.unique(item, return_index=True, return_counts=True)
+    from_end = np.repeat(start + count, count) - np.arange(len(item))
+    keep = from_end <= HISTORY_POINTS
+    return item[keep], provider[keep], cost[keep]
+
+def _group_median_mad(keys, values):
+    """Per-group median and MAD for integer group keys. Returns {key: (n, median, mad)}."""
+    if not len(values):
+        return {}
+
+    def medians(k, v):
+        order = np.lexsort((v, k))
+        k, v = k[order], v[order]
+        uniq, start, count = np.unique(k, return_index=True, return_counts=True)
+        lo = v[start + (count - 1) // 2]
+        hi = v[start + count // 2]
+        return uniq, count, (lo + hi) / 2
+
+    uniq, count, med = medians(keys, values)
+    med_of = med[np.searchsorted(uniq, keys)]
+    _, _, mad = medians(keys, np.abs(values - med_of))
+    return {int(k): (int(n), float(m), float(d)) for k, n, m, d in zip(uniq, count, med, mad)}
+
+def score_lines(purchase, series_dir):
+    """Returns one dict per purchase line (same order as purchase.lines)."""
+    lines = list(purchase.lines)
+    item_ids = sorted({l.catalog_item_id for l in lines if l.catalog_item_id})
+    items = {}
+    history = None
+    if item_ids:
+        items = catalog.get_many(item_ids) # catalog_cache.py, no query
+        history = _history(series_dir, item_ids, purchase.id)
+
+    # Group stats: per item, and per (item, provider) packed into one int64 key
+    if history is not None:
+        h_item, h_prov, h_cost = history
+        by_item = _group_median_mad(h_item, h_cost)
+        by_pair = _group_median_mad(h_item * 1_000_000 + h_prov, h_cost)
+    else:
+        by_item, by_pair = {}, {}
+
+    n = len(lines)
+    x = np.array([l.unit_cost or 0.0 for l in lines], dtype=float)
+    ref = np.zeros(n)
+    mad = np.zeros(n)
+    points = np.zeros(n, dtype=int)
+    current = np.zeros(n)
+    by_weight = np.zeros(n, dtype=bool)
+    qty = np.array([l.quantity or 0.0 for l in lines], dtype=float)
+
+    for i, line in enumerate(lines):
+        item = items.get(line.catalog_item_id)
+        if item is not None:
+            current[i] = item.current_cost or 0.0
+            by_weight[i] = bool(item.is_by_weight)
+        stats = by_pair.get(line.catalog_item_id * 1_000_000 + (purchase.provider_id or 0))
+        if not stats or stats[0] < MIN_POINTS:
+            stats = by_item.get(line.catalog_item_id)
+        if stats and stats[0] >= MIN_POINTS:
+            points[i], ref[i], mad[i] = stats
+        elif current[i] > 0:
+            ref[i] = current[i] # thin history: compare with the catalog cost
+
+    # Vectorized scoring
+    has_ref = ref > 0
+    rel = np.divide(x - ref, ref, out=np.zeros(n), where=has_ref)
+    z = np.divide(0.6745 * (x - ref), mad, out=np.zeros(n), where=mad > 0)
+    robust = mad > 0
+    meaningful = np.abs(rel) >= MIN_REL_DEVIATION
+
+    severity = np.zeros(n, dtype=int)
+    warn = has_ref & meaningful & np.where(robust, np.abs(z) >= Z_WARNING, np.abs(rel) >= FLAT_WARNING)
+    crit = has_ref & meaningful & np.where(robust, np.abs(z) >= Z_CRITICAL, np.abs(rel) >= FLAT_CRITICAL)
+    severity[warn] = 2
+    severity[crit] = 3
+
+    ratio = np.divide(x, ref, out=np.ones(n), where=has_ref & (x > 0))
+    unit_mismatch = has_ref & (x > 0) & ((ratio >= UNIT_FACTOR) | (ratio <= 1 / UNIT_FACTOR))
+    grams = by_weight & (qty >= GRAMS_QTY)
+    fractional = ~by_weight & (qty % 1 != 0)
+    severity[unit_mismatch | grams] = 3
+    severity[fractional & (severity < 1)] = 1
+    is_new = (current <= 0) & (points == 0) & (x > 0)
+    severity[is_new & (severity < 1)] = 1
+
+    results = []
+    for i, line in enumerate(lines):
+        # Legacy badge: catalog cost vs new cost
+        old_cost = current[i]
+        status, diff_pct = 'same', 0.0
+        if old_cost > 0:
+            diff = x[i] - old_cost
+            if abs(diff) > 0.01:
+                diff_pct = diff / old_cost * 100
+                status = 'up' if diff > 0 else 'down'
+        elif x[i] > 0:
+            status = 'new'
+
+        reasons = []
+        if unit_mismatch[i]:
+            kind = "kg vs und" if by_weight[i] else "caja vs unidad"
+            reasons.append(f"Precio x{ratio[i]:.1f} respecto a la referencia: ¿unidad incorrecta ({kind})?")
+        elif severity[i] >= 2:
+            against = "del histórico" if points[i] else "del costo actual"
+            reasons.append(f"Precio {'por encima' if rel[i] > 0 else 'por debajo'} {against} ({rel[i] * 100:+.0f}%)")
+        if grams[i]:
+            reasons.append(f"Cantidad {qty[i]:g} en item por peso: ¿gramos en vez de kg?")
+        if fractional[i]:
+            reasons.append("Cantidad fraccionaria en item por unidad")
+        if is_new[i]:
+            reasons.append("Sin historial de precios")
+
+        results.append({
+            'line_id': line.id,
+            'old_cost': float(old_cost),
+            'diff_pct': round(float(diff_pct), 1),
+            'status': status,
+            'severity': SEVERITIES[severity[i]],
+            'score': round(float(z[i]), 2) if robust[i] else None,
+            'reference': round(float(ref[i]), 4) if has_ref[i] else None,
+            'history_points': int(points[i]),
+            'reasons': reasons
+        })
+    return results
@@ -0,0 +1,307 @@
+import atexit
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from database import insert_returning_ids
+from models import AuditOutbox
+
+# Background audit log (purchase_history_log.csv / .jsonl).
+#
+# Request side:  entries = audit.stage(db.session, rows)  # before commit
+#                db.session.commit()
+#                audit.publish(entries)                     # after commit, never blocks
+#
+# - A bounded queue is drained by one writer thread that writes in batches and
+#   rotates the file by size or by day.
+# - fsync cadence: fsync_interval=0 -> every batch, N -> at most every N seconds,
+#   None -> never (flush only, the OS decides).
+# - durable=True: stage() also inserts the rows into audit_outbox inside the
+#   confirmation transaction. Outbox rows are deleted only after the file has been
+#   synced, so anything lost in the queue (crash, queue full) is replayed by the
+#   writer on startup and by a periodic sweep of rows older than REPLAY_GRACE.
+
+FORMATS = {'csv': '.csv', 'jsonl': '.jsonl'}
+log = logging.getLogger(__name__)
+
+REPLAY_GRACE = 60 # seconds; younger outbox rows may still be queued in another worker
+SWEEP_INTERVAL = 60
+SWEEP_BATCH = 5000
+DELETE_CHUNK = 900
+
+_STOP = object()
+
+class AuditLog:
+    def __init__(self, base_path, header, fmt='csv', max_bytes=10 * 1024 * 1024, rotate_daily=False,
+                 fsync_interval=1.0, durable=True, queue_size=10000, batch_size=500):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown audit log format '{fmt}'. Options: {', '.join(FORMATS)}")
+        self.path = base_path + FORMATS[fmt]
+        self.header = list(header)
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.fsync_interval = fsync_interval
+        self.durable = durable
+        self.batch_size = batch_size
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._engine = None
+        self._lock = threading.Lock() # guards _inflight
+        self._inflight = set() # outbox ids queued or written but not yet synced
+        self._unsynced = [] # outbox ids written since the last sync
+        self._fh = None
+        self._writer = None
+        self._dirty = False # written but not flushed
+        self._opened_day = None
+        self._last_sync = time.monotonic()
+        self._last_sweep = time.monotonic()
+        self.stats = {"queued": 0, "written": 0, "deferred": 0, "dropped": 0,
+                      "replayed": 0, "rotations": 0, "errors": 0, "last_error": None}
+
+    # --- Request side ---
+
+    def stage(self, session, rows):
+        """Call inside the transaction that produced the rows. Returns entries for publish()."""
+        rows = [list(row) for row in rows]
+        if not self.durable or not rows:
+            return [(None, row) for row in rows]
+        now = datetime.utcnow()
+        ids = insert_returning_ids(
+            session, AuditOutbox.__table__,
+            [{"payload": json.dumps(row, default=str), "created_at": now} for row in rows]
+        )
+        return list(zip(ids, rows))
+
+    def publish(self, entries):
+        """Hand committed entries to the writer thread. Never blocks the request."""
+        for entry in entries:
+            if entry[0] is not None:
+                with self._lock:
+                    self._inflight.add(entry[0])
+            try:
+                self._queue.put_nowait(entry)
+                self.stats["queued"] += 1
+            except queue.Full:
+                if entry[0] is not None:
+                    # Stays in the outbox, the next sweep writes it
+                    with self._lock:
+                        self._inflight.discard(entry[0])
+                    self.stats["deferred"] += 1
+                else:
+                    self.stats["dropped"] += 1
+
+    def flush(self, timeout=5.0):
+        """Wait until everything published so far is written and synced."""
+        if not self._thread or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(done, timeout=timeout)
+        return done.wait(timeout)
+
+    # --- Lifecycle ---
+
+    def start(self, engine=None):
+        if self._thread and self._thread.is_alive():
+            return
+        self._engine = engine
+        self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        if not self._thread or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    # --- Writer thread ---
+
+    def _run(self):
+        if self.durable and self._engine is not None:
+            self._sweep(min_age=REPLAY_GRACE) # startup replay
+
+        wait = self.fsync_interval or 0.5
+        while True:
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                self._sync()
+                if self.durable and self._engine is not None and time.monotonic() - self._last_sweep >= SWEEP_INTERVAL:
+                    self._sweep(min_age=REPLAY_GRACE)
+                continue
+
+            batch = []
+            markers = []
+            stop = False
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+            if markers or stop or self.fsync_interval == 0 or \
+                    (self.fsync_interval and time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            for marker in markers:
+                marker.set()
+            if stop:
+                self._close()
+                return
+
+    def _write(self, entries):
+        try:
+            self._rotate_if_needed()
+            for _, row in entries:
+                if self.fmt == 'csv':
+                    self._writer.writerow(row)
+                else:
+                    self._fh.write(json.dumps(dict(zip(self.header, row)), default=str) + '\n')
+            self._dirty = True
+            self._unsynced.extend(oid for oid, _ in entries if oid is not None)
+            self.stats["written"] += len(entries)
+        except Exception as e:
+            # Outbox rows are kept (not in _unsynced) and replayed by the sweep
+            self._error(e)
+            with self._lock:
+                self._inflight.difference_update(oid for oid, _ in entries)
+
+    def _fsync_file(self):
+        self._fh.flush()
+        if self.fsync_interval is not None:
+            os.fsync(self._fh.fileno())
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def _sync(self):
+        if self._fh is None or not (self._dirty or self._unsynced):
+            return
+        try:
+            self._fsync_file()
+            if self._unsynced and self._engine is not None:
+                ids, self._unsynced = self._unsynced, []
+                table = AuditOutbox.__table__
+                with self._engine.begin() as conn:
+                    for i in range(0, len(ids), DELETE_CHUNK):
+                        conn.execute(delete(table).where(table.c.id.in_(ids[i:i + DELETE_CHUNK])))
+                with self._lock:
+                    self._inflight.difference_update(ids)
+        except Exception as e:
+            self._error(e)
+
+    def _sweep(self, min_age):
+        # Claim orphaned outbox rows (DELETE ... RETURNING holds the write lock until
+        # the rows are on disk, so two workers never replay the same row)
+        self._last_sweep = time.monotonic()
+        table = AuditOutbox.__table__
+        cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+        try:
+            with self._engine.begin() as conn:
+                claimed = conn.execute(
+                    delete(table).where(table.c.id.in_(
+                        select(table.c.id).where(table.c.created_at < cutoff).order_by(table.c.id).limit(SWEEP_BATCH)
+                    )).returning(table.c.id, table.c.payload)
+                ).all()
+                with self._lock:
+                    # Our own queued rows get written by the normal path
+                    entries = [(None, json.loads(payload)) for oid, payload in sorted(claimed) if oid not in self._inflight]
+                if entries:
+                    self._write(entries)
+                    self._fsync_file() # before the claim commits
+                    self.stats["replayed"] += len(entries)
+        except Exception as e:
+            self._error(e)
+
+    def _is_current(self):
+        # False once another worker has rotated the path away from the file we hold open
+        try:
+            return os.fstat(self._fh.fileno()).st_ino == os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _rotation_stamp(self, today):
+        if self._fh is None:
+            if not os.path.exists(self.path) or not os.path.getsize(self.path):
+                return None
+            # Left over from a previous run on another day, or full
+            day = datetime.fromtimestamp(os.path.getmtime(self.path)).date()
+            if self.rotate_daily and day != today:
+                return day.isoformat()
+            size = os.path.getsize(self.path)
+        elif self.rotate_daily and self._opened_day != today:
+            return self._opened_day.isoformat()
+        else:
+            size = os.fstat(self._fh.fileno()).st_size # all workers' rows, not just our tell()
+        if self.max_bytes and size >= self.max_bytes:
+            return datetime.now().strftime('%Y%m%d-%H%M%S')
+        return None
+
+    def _follow(self):
+        if self._fh is not None and not self._is_current():
+            self._fsync_file()
+            self._close() # reopen the path the rotating worker created
+
+    def _rotate_if_needed(self):
+        # Workers share the path: rotating and opening happen under an flock with the
+        # checks repeated there, and a worker whose file was rotated away reopens the
+        # new one instead of rotating again.
+        today = datetime.now().date()
+        self._follow()
+        if self._fh is not None and not self._rotation_stamp(today):
+            return
+        import fcntl
+        with open(self.path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._follow()
+            stamp = self._rotation_stamp(today)
+            if stamp:
+                if self._fh is not None:
+                    self._fsync_file()
+                    self._close()
+                base, ext = os.path.splitext(self.path)
+                target = f"{base}.{stamp}{ext}"
+                n = 1
+                while os.path.exists(target):
+                    target = f"{base}.{stamp}-{n}{ext}"
+                    n += 1
+                os.replace(self.path, target)
+                self.stats["rotations"] += 1
+
+            if self._fh is None:
+                self._fh = open(self.path, mode='a', newline='', encoding='utf-8')
+                self._opened_day = today
+                if self.fmt == 'csv':
+                    self._writer = csv.writer(self._fh)
+                    if self._fh.tell() == 0:
+                        self._writer.writerow(self.header)
+                        self._fh.flush() # before the lock goes: the next worker sees a header
+
+    def _close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            self._writer = None
+
+    def _error(self, e):
+        self.stats["errors"] += 1
+        self.stats["last_error"] = str(e)
+        log.error("Audit log error: %s", e)
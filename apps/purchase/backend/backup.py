@@ -0,0 +1,254 @@
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+
+# Online backups and restore of the SQLite database.
+#
+# - snapshot(): consistent copy of the live file while the app keeps writing.
+#   WAL (default profile): VACUUM INTO runs in one read transaction, writers never
+#   wait and the copy comes out compacted. Rollback journal: the backup API copies
+#   BACKUP_PAGES pages per step and releases the lock in between (a concurrent write
+#   restarts the copy, it never reads a torn page).
+# - stream_gzip(): snapshot to a temp file, then gzip it to the client in CHUNK_SIZE
+#   pieces; the temp file is removed when the download ends.
+# - restore(): the upload is unpacked (.db or .db.gz) into a temp file next to the
+#   backups and checked (SQLite header, PRAGMA integrity_check, core tables) before
+#   anything is touched. The live DB is saved first (pre-restore snapshot), the pool is
+#   drained and the file is swapped in with the backup API in one write transaction:
+#   other connections see the old or the new DB, never a mix, and the WAL/-shm files
+#   stay consistent (os.replace under a WAL database would corrupt it). The upload gets
+#   a new sync epoch first: change_log versions restart from the backup's, so offline
+#   clients must resync (sync_feed.py) and the price series is rebuilt (price_series.py).
+# - BackupScheduler: every BACKUP_INTERVAL minutes a FULL snapshot into BACKUP_DIR as
+#   purchase_app-<stamp>.db.gz, skipped when the DB files have not changed since the
+#   last one (change detection, not incremental backups: each file restores on its own
+#   and costs a whole compressed copy); the newest BACKUP_KEEP are kept. A lock file
+#   lets one worker per host run.
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+BACKUP_PAGES = 1024 # pages per backup step (rollback journal only)
+BACKUP_SLEEP = 0.005 # seconds between steps, writers get the lock
+SQLITE_HEADER = b'SQLite format 3\x00'
+REQUIRED_TABLES = {'providers', 'catalog_items', 'purchases', 'purchase_lines'}
+PREFIX = 'purchase_app-'
+SUFFIX = '.db.gz'
+
+class RestoreError(ValueError):
+    pass
+
+def database_path(engine):
+    path = engine.url.database
+    if engine.dialect.name != 'sqlite' or not path or path == ':memory:':
+        raise ValueError("Backups need a file-based SQLite database")
+    return os.path.abspath(path)
+
+def snapshot(engine, dest):
+    """Consistent copy of the live database into dest (must not exist)."""
+    src = sqlite3.connect(database_path(engine), timeout=30)
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal':
+            src.execute("VACUUM INTO ?", (dest,))
+        else:
+            target = sqlite3.connect(dest)
+            try:
+                src.backup(target, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP)
+            finally:
+                target.close()
+    finally:
+        src.close()
+    return dest
+
+def _temp_path(directory, suffix):
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    os.close(fd)
+    os.remove(path) # VACUUM INTO wants a new file
+    return path
+
+def _stamped(directory, suffix):
+    base = os.path.join(directory, f"{PREFIX}{datetime.now():%Y%m%d-%H%M%S}")
+    target, n = base + suffix, 1
+    while os.path.exists(target):
+        target = f"{base}-{n}{suffix}"
+        n += 1
+    return target
+
+def stream_gzip(engine, work_dir):
+    """Snapshot now, then yield it gzip-compressed in chunks (for a streamed response)."""
+    path = snapshot(engine, _temp_path(work_dir, '.db'))
+
+    def generate():
+        try:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # 31: gzip container
+            with open(path, 'rb') as fh:
+                while chunk := fh.read(CHUNK_SIZE):
+                    data = compressor.compress(chunk)
+                    if data:
+                        yield data
+            yield compressor.flush()
+        finally:
+            os.remove(path)
+    return generate()
+
+def _unpack(stream, dest):
+    head = stream.read(2)
+    stream.seek(0)
+    source = gzip.GzipFile(fileobj=stream, mode='rb') if head == b'\x1f\x8b' else stream
+    with open(dest, 'wb') as out:
+        try:
+            shutil.copyfileobj(source, out, CHUNK_SIZE)
+        except (OSError, EOFError, zlib.error) as e:
+            raise RestoreError(f"Corrupt gzip upload: {e}")
+
+def validate(path):
+    """Raise RestoreError unless path is an intact database of this app."""
+    with open(path, 'rb') as fh:
+        if fh.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+            raise RestoreError("Not an SQLite database")
+    conn = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        if problems != ['ok']:
+            raise RestoreError(f"Integrity check failed: {'; '.join(problems[:5])}")
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = REQUIRED_TABLES - tables
+        if missing:
+            raise RestoreError(f"Missing tables: {', '.join(sorted(missing))}")
+    except sqlite3.DatabaseError as e:
+        raise RestoreError(f"Unreadable database: {e}")
+    finally:
+        conn.close()
+
+def _new_epoch(path):
+    # A fresh epoch with no pruned tombstones: every cursor handed out so far resets
+    from sync_feed import new_epoch
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sync_meta (key VARCHAR(50) PRIMARY KEY, value VARCHAR(100))")
+            conn.execute("INSERT OR REPLACE INTO sync_meta (key, value) VALUES ('epoch', ?), ('pruned_version', '0')",
+                         (new_epoch(),))
+    finally:
+        conn.close()
+
+def restore(engine, stream, work_dir):
+    """
+    Replace the live database with an uploaded .db / .db.gz. Raises RestoreError for a
+    bad upload (live DB untouched). Returns the pre-restore snapshot path.
+    The caller disposes sessions first and brings the schema up to date afterwards.
+    """
+    upload = _temp_path(work_dir, '.upload.db')
+    try:
+        _unpack(stream, upload)
+        validate(upload)
+        _new_epoch(upload)
+        saved = snapshot(engine, _stamped(work_dir, '-pre-restore.db'))
+
+        engine.dispose() # drain the pool: no pooled connection outlives the old file
+        src = sqlite3.connect(upload)
+        dst = sqlite3.connect(database_path(engine), timeout=30)
+        try:
+            src.backup(dst) # all pages in one step: one write transaction
+        finally:
+            dst.close()
+            src.close()
+        from price_series import invalidate_series
+        invalidate_series()
+        return saved
+    finally:
+        if os.path.exists(upload):
+            os.remove(upload)
+
+def list_backups(directory):
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((n for n in os.listdir(directory) if n.startswith(PREFIX)), reverse=True)
+    return [{"name": n, "size": os.path.getsize(os.path.join(directory, n)),
+             "created_at": datetime.fromtimestamp(os.path.getmtime(os.path.join(directory, n))).isoformat(timespec='seconds')}
+            for n in names]
+
+def write_backup(engine, directory):
+    """One compressed snapshot in directory. Returns its path."""
+    raw = snapshot(engine, _temp_path(directory, '.db'))
+    target = _stamped(directory, SUFFIX)
+    try:
+        with open(raw, 'rb') as src, gzip.open(target + '.part', 'wb') as out:
+            shutil.copyfileobj(src, out, CHUNK_SIZE)
+        os.replace(target + '.part', target)
+    finally:
+        os.remove(raw)
+    return target
+
+def prune_backups(directory, keep):
+    """Keep the newest `keep` scheduled backups (pre-restore snapshots are left alone)."""
+    names = sorted(n for n in os.listdir(directory) if n.startswith(PREFIX) and n.endswith(SUFFIX))
+    for name in (names[:-keep] if keep else []):
+        os.remove(os.path.join(directory, name))
+
+class BackupScheduler:
+    """Full compressed snapshots on a timer, skipped while the database is unchanged."""
+
+    def __init__(self, directory, interval_minutes, keep=48):
+        self.directory = directory
+        self.interval = interval_minutes * 60
+        self.keep = keep
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_state = None
+        self.stats = {"backups": 0, "skipped": 0, "errors": 0, "last_backup": None, "last_error": None}
+
+    def start(self, engine):
+        if not self.interval or (self._thread and self._thread.is_alive()):
+            return
+        self._engine = engine
+        self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _state(self):
+        # Changes land in the -wal file first, then in the DB on checkpoint
+        path = database_path(self._engine)
+        return tuple((os.stat(p).st_mtime_ns, os.stat(p).st_size) if os.path.exists(p) else None
+                     for p in (path, path + '-wal'))
+
+    def _newest_age(self):
+        names = [n for n in os.listdir(self.directory) if n.startswith(PREFIX) and n.endswith(SUFFIX)]
+        if not names:
+            return None
+        return time.time() - os.path.getmtime(os.path.join(self.directory, max(names)))
+
+    def _run(self):
+        import fcntl
+        while not self._stop.wait(self.interval):
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue # another worker is writing one
+                    age = self._newest_age()
+                    state = self._state()
+                    if state == self._last_state or (age is not None and age < self.interval / 2):
+                        self.stats["skipped"] += 1
+                        continue
+                    path = write_backup(self._engine, self.directory)
+                    self._last_state = state
+                    prune_backups(self.directory, self.keep)
+                    self.stats["backups"] += 1
+                    self.stats["last_backup"] = os.path.basename(path)
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(e)
+                log.error("Scheduled backup failed: %s", e)
@@ -0,0 +1,141 @@
+"""
+Benchmark: read throughput while purchases are being confirmed, per SQLite profile.
+
+Each profile runs against a throwaway DB (one process per profile, settings come
+from the environment). Writer processes create + confirm drafts through the real endpoints;
+reader processes hit the catalog / provider APIs, like separate gunicorn workers.
+Readers only use endpoints without @cache.cached: a cache hit never reaches SQLite,
+so cached endpoints would measure the response cache instead of the profile.
+
+    python bench_concurrency.py                      # default vs wal, 10s each
+    python bench_concurrency.py --seconds 20 --readers 8 --writers 2
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+PROFILES = ['default', 'wal']
+# Uncached reads ({provider} / {item}: a random seeded id per request)
+READ_URLS = ['/api/purchases/recent', '/api/providers/{provider}/history',
+             '/api/analysis/comparison/{item}', '/api/catalog/search?q=item {item}']
+
+def seed(db, Provider, CatalogItem, n_items=2000, n_providers=30):
+    db.session.add_all([Provider(name=f"Proveedor {i}", normalized_name=f"proveedor {i}") for i in range(n_providers)])
+    db.session.execute(CatalogItem.__table__.insert(), [
+        {"loyverse_id": f"bench-{i}", "sku": str(i), "name": f"Item {i}", "current_cost": 1.0 + i % 50,
+         "default_unit": "und", "is_by_weight": False, "is_pending": False}
+        for i in range(n_items)
+    ])
+    db.session.commit()
+
+def _load_app():
+    from app import create_app
+    tmpdir = os.path.dirname(os.environ['PURCHASE_DB_URI'][len('sqlite:///'):])
+    # keep the audit CSV and cache out of the repo
+    return create_app({'AUDIT_LOG_PATH': os.path.join(tmpdir, 'purchase_history_log'),
+                       'CACHE_PATH': os.path.join(tmpdir, 'purchase_cache.db')})
+
+def reader(seconds, results, provider_ids, item_ids):
+    app = _load_app()
+    client = app.test_client()
+    reads, errors, latencies = 0, 0, []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        url = random.choice(READ_URLS).format(provider=random.choice(provider_ids), item=random.choice(item_ids))
+        res = client.get(url)
+        if res.status_code == 200:
+            reads += 1
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    results.put({"reads": reads, "writes": 0, "errors": errors, "latencies": latencies})
+
+def writer(seconds, results, provider_ids, item_ids):
+    app = _load_app()
+    client = app.test_client()
+    writes, errors = 0, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        lines = [{"catalog_item_id": iid, "catalog_item_name": f"Item {iid}", "quantity": 2,
+                  "unit_cost": round(random.uniform(1, 60), 2), "total_cost": 10}
+                 for iid in random.sample(item_ids, 10)]
+        res = client.post('/api/purchases', json={"provider_id": random.choice(provider_ids), "items": lines})
+        ok = res.status_code == 201
+        if ok:
+            res = client.post(f"/api/purchases/{res.json['id']}/confirm")
+            ok = res.status_code == 200
+        if ok:
+            writes += 1
+        else:
+            errors += 1
+    results.put({"reads": 0, "writes": writes, "errors": errors, "latencies": []})
+
+def run_profile(seconds, n_readers, n_writers):
+    # One OS process per reader/writer, like gunicorn workers (threads would just share the GIL)
+    import multiprocessing as mp
+    from database import db
+    from models import Provider, CatalogItem
+
+    app = _load_app()
+    with app.app_context():
+        seed(db, Provider, CatalogItem)
+        provider_ids = [p.id for p in Provider.query.all()]
+        item_ids = [iid for (iid,) in db.session.query(CatalogItem.id).all()]
+        db.engine.dispose()
+
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    procs = [ctx.Process(target=reader, args=(seconds, results, provider_ids, item_ids)) for _ in range(n_readers)]
+    procs += [ctx.Process(target=writer, args=(seconds, results, provider_ids, item_ids)) for _ in range(n_writers)]
+    for p in procs:
+        p.start()
+    parts = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    stats = {key: sum(part[key] for part in parts) for key in ("reads", "writes", "errors")}
+    latencies = sorted(l for part in parts for l in part["latencies"]) or [0]
+    stats["reads_per_s"] = round(stats["reads"] / seconds, 1)
+    stats["confirms_per_s"] = round(stats["writes"] / seconds, 1)
+    stats["read_p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 2)
+    stats["read_p99_ms"] = round(latencies[int(len(latencies) * 0.99)] * 1000, 2)
+    print(json.dumps(stats))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_profile(args.seconds, args.readers, args.writers)
+        return
+
+    print(f"{args.readers} readers / {args.writers} writers, {args.seconds}s per profile\n")
+    print(f"{'profile':<10} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'confirms/s':>11} {'errors':>7}")
+    for profile in PROFILES:
+        tmpdir = tempfile.mkdtemp()
+        env = dict(os.environ,
+                   PURCHASE_DB_URI='sqlite:///' + os.path.join(tmpdir, 'bench.db'),
+                   PURCHASE_DB_PROFILE=profile)
+        out = subprocess.run(
+            [sys.executable, __file__, '--child', '--seconds', str(args.seconds),
+             '--readers', str(args.readers), '--writers', str(args.writers)],
+            env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if out.returncode != 0:
+            print(f"{profile:<10} failed:\n{out.stderr[-2000:]}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{profile:<10} {r['reads_per_s']:>9} {r['read_p50_ms']:>8} {r['read_p99_ms']:>8} {r['confirms_per_s']:>11} {r['errors']:>7}")
+
+if __name__ == "__main__":
+    main()
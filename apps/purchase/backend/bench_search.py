@@ -0,0 +1,68 @@
+"""
+Benchmark: catalog search, FTS5 index vs legacy ILIKE scan.
+
+Builds a throwaway SQLite DB with N synthetic items (default 100k) and times
+the queries typed from add_product / comparison / smart_shopping.
+
+    python bench_search.py            # 100k items
+    python bench_search.py 250000     # custom size
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from flask import Flask
+from database import db, init_db
+from models import CatalogItem
+from catalog_search import search_items, search_items_ilike
+
+WORDS = ["Café", "molido", "Leche", "entera", "Azúcar", "refinada", "Harina", "trigo", "Vaso",
+         "cartón", "Aceite", "oliva", "Queso", "fresco", "Jamón", "serrano", "Pimentón", "dulce",
+         "Tomate", "perita", "Cebolla", "morada", "Limón", "Piña", "Maíz", "Arroz", "Chocolate"]
+SIZES = ["250gr", "500gr", "1kg", "1L", "12oz", "x24", ""]
+QUERIES = ["ca", "cafe", "cafe mol", "leche ent", "azucar", "pina", "jamon serr", "500gr", "x24", "0023", "zzz"]
+
+def seed(n):
+    rnd = random.Random(42)
+    rows = []
+    for i in range(n):
+        name = " ".join(rnd.sample(WORDS, 3)) + " " + rnd.choice(SIZES)
+        rows.append({
+            "loyverse_id": f"bench-{i}",
+            "sku": f"{10000 + i}",
+            "name": name.strip(),
+            "default_unit": "und",
+            "is_by_weight": False,
+            "current_cost": round(rnd.uniform(0.5, 50), 2),
+            "is_pending": False,
+        })
+    db.session.execute(CatalogItem.__table__.insert(), rows)
+    db.session.commit()
+
+def timed(fn, query, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = fn(query, limit=30)
+    return (time.perf_counter() - start) / repeat * 1000, len(results)
+
+def run(n, repeat=20):
+    tmpdir = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    init_db(app)
+
+    with app.app_context():
+        print(f"Seeding {n} items...")
+        t0 = time.perf_counter()
+        seed(n)
+        print(f"Seeded in {time.perf_counter() - t0:.1f}s (FTS kept in sync by triggers)\n")
+
+        print(f"{'query':<12} {'ILIKE ms':>10} {'FTS ms':>10} {'speedup':>9} {'hits':>6}")
+        for q in QUERIES:
+            ilike_ms, _ = timed(search_items_ilike, q, repeat)
+            fts_ms, hits = timed(search_items, q, repeat)
+            print(f"{q:<12} {ilike_ms:>10.2f} {fts_ms:>10.2f} {ilike_ms / max(fts_ms, 1e-6):>8.1f}x {hits:>6}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,97 @@
+"""
+Benchmark: startup cost of the app, the maintenance scripts and a test fixture.
+
+Cold start: each phase runs in a fresh interpreter (median of --runs) against a
+throwaway DB that already has the current schema, like a restarted worker:
+
+    interpreter        python -c pass
+    framework imports  flask + flask_sqlalchemy + sqlalchemy
+    script app         create_app(web=False)       (manage.py commands)
+    web app            create_app()                (python app.py / gunicorn)
+    first request      create_app() + GET /api/providers
+
+Per-test setup: create_app() on a fresh DB file, in-process, the way a test
+fixture would build one app per test.
+
+    python bench_startup.py              # 7 runs per phase
+    python bench_startup.py --runs 15
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASES = {
+    'interpreter': "pass",
+    'framework imports': "import flask, flask_sqlalchemy, sqlalchemy",
+    'script app': "from app import create_app; create_app(web=False)",
+    'web app': "from app import create_app; create_app()",
+    'first request': "from app import create_app; assert create_app().test_client().get('/api/providers').status_code == 200",
+}
+
+def _env(tmpdir):
+    return dict(os.environ,
+                PURCHASE_DB_URI='sqlite:///' + os.path.join(tmpdir, 'bench.db'),
+                PURCHASE_AUDIT_LOG=os.path.join(tmpdir, 'purchase_history_log'),
+                PURCHASE_CACHE_PATH=os.path.join(tmpdir, 'purchase_cache.db'),
+                PURCHASE_LOG_LEVEL='WARNING')
+
+def cold_start(runs, tmpdir):
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = _env(tmpdir)
+    # Schema built once: the timed runs only check it, like a restart
+    subprocess.run([sys.executable, '-c', PHASES['script app']], env=env, cwd=here, check=True)
+    results = {}
+    for phase, code in PHASES.items():
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], env=env, cwd=here, check=True)
+            times.append(time.perf_counter() - start)
+        results[phase] = times
+    return results
+
+def per_test_setup(runs, tmpdir):
+    from app import create_app
+    results = {'script app': [], 'web app': []}
+    for n in range(runs):
+        for phase, web in (('script app', False), ('web app', True)):
+            path = os.path.join(tmpdir, f'test-{phase[0]}-{n}')
+            os.makedirs(path)
+            start = time.perf_counter()
+            app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(path, 'test.db'),
+                              'AUDIT_LOG_PATH': os.path.join(path, 'purchase_history_log')}, web=web)
+            results[phase].append(time.perf_counter() - start)
+            if web:
+                app.extensions['audit_log'].stop()
+    return results
+
+def _row(label, times):
+    ms = sorted(t * 1000 for t in times)
+    return f"{label:<20} {statistics.median(ms):>9.1f} {ms[0]:>9.1f} {ms[-1]:>9.1f}"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        header = f"{'':<20} {'median ms':>9} {'min':>9} {'max':>9}"
+        print(f"Cold start (fresh interpreter, {args.runs} runs)\n{header}")
+        for phase, times in cold_start(args.runs, tmpdir).items():
+            print(_row(phase, times))
+
+        os.environ.update(_env(tmpdir))
+        print(f"\nPer-test setup (create_app on a fresh DB, in-process, {args.runs} runs)\n{header}")
+        for phase, times in per_test_setup(args.runs, tmpdir).items():
+            print(_row(phase, times))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
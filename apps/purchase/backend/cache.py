@@ -0,0 +1,207 @@
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import request, current_app
+
+# Response cache for read-heavy JSON endpoints.
+#
+#   @bp.route('/api/providers')
+#   @cache.cached(tags=('providers',))
+#   def get_providers(): ...
+#
+#   db.session.commit()
+#   cache.invalidate('providers')   # after the commit, never before
+#
+# - Entries are keyed by path + query args + the current generation of each tag.
+#   invalidate() bumps the generation, so stale entries are never read again and
+#   simply age out (TTL / LRU). A reader that raced a write stores its result under
+#   the old generation, where nobody looks.
+# - Backends: 'memory' (per-process LRU, single worker) and 'sqlite' (one shared
+#   file, entries and generations visible to every worker on the host).
+# - Every cached response carries an ETag; If-None-Match gets a 304 with no body.
+# - CACHED_HEADERS (pagination links) are stored with the body and replayed on hits.
+
+CACHED_HEADERS = ('Link', 'X-Next-Cursor')
+
+class MemoryBackend:
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key -> (expires_at, body, etag, headers)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generations(self, tags):
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1:]
+
+    def set(self, key, body, etag, headers, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, body, etag, headers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteBackend:
+    """Host-local cache shared by all workers (one small WAL database)."""
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body BLOB, etag TEXT, headers TEXT, expires_at REAL, accessed_at REAL)",
+        "CREATE INDEX IF NOT EXISTS ix_responses_accessed ON responses (accessed_at)",
+        "CREATE TABLE IF NOT EXISTS generations (tag TEXT PRIMARY KEY, gen INTEGER NOT NULL)",
+    ]
+    EVICT_EVERY = 100 # sets between LRU trims
+
+    def __init__(self, path, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._sets = 0
+        with self._conn() as conn:
+            for sql in self.SCHEMA:
+                conn.execute(sql)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF") # a cache: losing it only costs a recompute
+            self._local.conn = conn
+        return conn
+
+    def generations(self, tags):
+        rows = dict(self._conn().execute(
+            f"SELECT tag, gen FROM generations WHERE tag IN ({','.join('?' * len(tags))})", tags
+        ).fetchall())
+        return tuple(rows.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO generations (tag, gen) VALUES (?, 1) ON CONFLICT(tag) DO UPDATE SET gen = gen + 1",
+                [(tag,) for tag in tags]
+            )
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute("SELECT body, etag, headers, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[3] < time.time():
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0], row[1], tuple(map(tuple, json.loads(row[2])))
+
+    def set(self, key, body, etag, headers, ttl):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, etag, headers, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, etag, json.dumps(headers), now + ttl, now)
+            )
+            self._sets += 1
+            if self._sets % self.EVICT_EVERY == 0:
+                conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM responses")
+
+def make_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+class ResponseCache:
+    def __init__(self, backend=None, default_ttl=300):
+        self.backend = backend or MemoryBackend()
+        self.default_ttl = default_ttl
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+        self._stats_lock = threading.Lock() # views run on several threads per worker
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def init_app(self, app):
+        """Pick the backend from CACHE_BACKEND / CACHE_PATH / CACHE_TTL (views decorate before this)."""
+        self.backend = _backend(app.config.get('CACHE_BACKEND', 'memory'), app.config.get('CACHE_PATH'))
+        self.default_ttl = app.config.get('CACHE_TTL', self.default_ttl)
+
+    def invalidate(self, *tags):
+        """Call after the write has been committed."""
+        if tags:
+            self.backend.bump(tags)
+            self._count("invalidations")
+
+    def cached(self, tags, ttl=None):
+        tags = tuple(sorted(tags))
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                # Generations are read before the view queries the DB (see module notes)
+                args_key = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+                gens = '.'.join(str(g) for g in self.backend.generations(tags))
+                key = f"{request.path}?{args_key}#{gens}"
+
+                hit = self.backend.get(key)
+                if hit is not None:
+                    self._count("hits")
+                    body, etag, headers = hit
+                    return self._respond(body, etag, headers=headers)
+
+                self._count("misses")
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                etag = make_etag(body)
+                headers = tuple((name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers)
+                self.backend.set(key, body, etag, headers, ttl or self.default_ttl)
+                return self._respond(body, etag, response)
+            return wrapper
+        return decorator
+
+    def _respond(self, body, etag, response=None, headers=()):
+        if response is None:
+            response = current_app.response_class(body, mimetype='application/json')
+            response.headers.extend(headers)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache' # always revalidate, 304 when unchanged
+        response.make_conditional(request)
+        if response.status_code == 304:
+            self._count("not_modified")
+        return response
+
+def _backend(backend_name, path=None):
+    if backend_name == 'sqlite':
+        return SQLiteBackend(path)
+    if backend_name == 'memory':
+        return MemoryBackend()
+    raise ValueError(f"Unknown cache backend '{backend_name}'. Options: memory, sqlite")
@@ -0,0 +1,142 @@
+import re
+import threading
+import time
+from sqlalchemy import event, text, bindparam
+
+# In-process catalog read model for the hot paths (draft creation, anomaly review,
+# delete_purchase, optimizer): id -> CatalogEntry, one slotted object per item.
+#
+#   items = catalog.get_many(ids)   # {id: entry} for the ids that exist
+#   items[iid].current_cost
+#
+# - Loaded on first use, then refreshed from change_log (sync_feed.py): the triggers
+#   log every catalog_items write (ORM, bulk, raw SQL, other workers) with a growing
+#   version, so a refresh reads only the ids changed since the last version seen.
+# - Write hooks on the engine flag commits that wrote catalog_items: the next lookup
+#   in this worker refreshes first, so it always sees its own writes. Other workers'
+#   writes are picked up by a check (one indexed query) at most every CHECK_INTERVAL
+#   seconds, and right away when a lookup misses an id (an item created elsewhere).
+#   Steady state: lookups are dict reads, no SQL.
+# - A new epoch (restore of another DB), a version that went backwards (restore of an
+#   older backup) or more than RELOAD_OVER changes at once: full reload.
+# - Refreshes read committed data on their own connection: a rolled-back write never
+#   reaches the model.
+# - Entries are snapshots for lookups and validation. Writers that need the exact
+#   current cost inside their transaction (confirmation) still read the row.
+
+RELOAD_OVER = 5000
+IN_CHUNK = 900
+CHECK_INTERVAL = 1.0 # seconds
+MISS_RECHECK = 0.05 # seconds: a miss right after a check is a real miss
+
+_WRITE = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+_COLUMNS = "id, name, sku, default_unit, is_by_weight, current_cost, is_pending"
+
+class CatalogEntry:
+    __slots__ = ('id', 'name', 'sku', 'default_unit', 'is_by_weight', 'current_cost', 'is_pending')
+
+    def __init__(self, id, name, sku, default_unit, is_by_weight, current_cost, is_pending):
+        self.id = id
+        self.name = name
+        self.sku = sku
+        self.default_unit = default_unit
+        self.is_by_weight = bool(is_by_weight)
+        self.current_cost = current_cost
+        self.is_pending = bool(is_pending)
+
+class CatalogReadModel:
+    def __init__(self, engine):
+        self.engine = engine
+        self._items = None # id -> CatalogEntry
+        self._epoch = None
+        self._version = 0 # change_log version applied
+        self._dirty = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"size": 0, "loads": 0, "checks": 0, "refreshed_items": 0}
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+        event.listen(engine, 'commit', self._on_commit)
+        event.listen(engine, 'rollback', self._on_rollback)
+
+    # --- Write hooks ---
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if 'catalog_items' in statement and _WRITE.match(statement):
+            conn.info['catalog_written'] = True
+
+    def _on_commit(self, conn):
+        if conn.info.pop('catalog_written', False):
+            self._dirty = True
+
+    def _on_rollback(self, conn):
+        conn.info.pop('catalog_written', None)
+
+    # --- Lookups ---
+
+    def get(self, item_id):
+        return self.get_many((item_id,)).get(item_id)
+
+    def get_many(self, ids):
+        """{id: entry} for the ids that exist (a miss forces a check first)."""
+        ids = set(ids)
+        items = self._current()
+        found = {iid: items[iid] for iid in ids if iid in items}
+        if len(found) < len(ids) and time.monotonic() - self._checked_at > MISS_RECHECK:
+            items = self._current(force=True)
+            found = {iid: items[iid] for iid in ids if iid in items}
+        return found
+
+    def _current(self, force=False):
+        if force or self._items is None or self._dirty or time.monotonic() - self._checked_at > CHECK_INTERVAL:
+            with self._lock:
+                self._dirty = False # before the check: a commit during it marks it again
+                self._checked_at = time.monotonic()
+                if self._items is None:
+                    self._load()
+                else:
+                    self._refresh()
+        return self._items
+
+    # --- Loading ---
+
+    def _meta(self, conn):
+        return conn.execute(text(
+            "SELECT (SELECT value FROM sync_meta WHERE key = 'epoch'), (SELECT COALESCE(MAX(version), 0) FROM change_log)"
+        )).one()
+
+    def _load(self):
+        with self.engine.connect() as conn:
+            epoch, version = self._meta(conn) # before the rows: later changes get replayed
+            self._items = {row[0]: CatalogEntry(*row) for row in conn.execute(text(f"SELECT {_COLUMNS} FROM catalog_items"))}
+        self._epoch, self._version = epoch, version
+        self.stats["loads"] += 1
+        self.stats["size"] = len(self._items)
+
+    def _refresh(self):
+        self.stats["checks"] += 1
+        with self.engine.connect() as conn:
+            epoch, version = self._meta(conn)
+            if epoch != self._epoch or version < self._version:
+                return self._load()
+            if version == self._version:
+                return
+            changes = conn.execute(text(
+                "SELECT entity_id, op FROM change_log WHERE version > :seen AND entity = 'catalog' ORDER BY version LIMIT :cap"
+            ), {"seen": self._version, "cap": RELOAD_OVER + 1}).all()
+            if len(changes) > RELOAD_OVER:
+                return self._load()
+
+            upserts = [iid for iid, op in changes if op == 'upsert']
+            rows = {}
+            stmt = text(f"SELECT {_COLUMNS} FROM catalog_items WHERE id IN :ids").bindparams(bindparam('ids', expanding=True))
+            for i in range(0, len(upserts), IN_CHUNK):
+                rows.update((row[0], row) for row in conn.execute(stmt, {"ids": upserts[i:i + IN_CHUNK]}))
+        for iid, op in changes:
+            if iid in rows:
+                self._items[iid] = CatalogEntry(*rows[iid])
+            else:
+                self._items.pop(iid, None) # deleted (tombstone, or gone since the log row)
+        self._version = version
+        self.stats["refreshed_items"] += len(changes)
+        self.stats["size"] = len(self._items)
@@ -0,0 +1,135 @@
+import logging
+import re
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from database import db
+from models import CatalogItem
+
+# Full-text index over catalog_items (SQLite FTS5).
+# - External content table: the index stores only tokens, rows live in catalog_items.
+# - unicode61 + remove_diacritics: "cafe" matches "Café molido 500gr".
+# - prefix='2 3': short prefixes typed on every keystroke hit a prefix index instead of scanning.
+# Triggers keep it in sync with ANY write (ORM, bulk upserts, raw SQL).
+# Pending items are filtered on the join, so promotion (is_pending -> False) is visible at once.
+
+log = logging.getLogger(__name__)
+
+FTS_TABLE = 'catalog_items_fts'
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, sku,
+        content='catalog_items', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2",
+        prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_items_fts_ai AFTER INSERT ON catalog_items BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_items_fts_ad AFTER DELETE ON catalog_items BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_items_fts_au AFTER UPDATE OF name, sku ON catalog_items BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+        INSERT INTO {FTS_TABLE}(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+]
+
+# Name matches weigh more than SKU matches in bm25 ranking.
+# Pending items are filtered inside the candidate query, so they never take a slot.
+# Queries whose tokens all have 3+ characters rank the whole match (ORDER BY ... LIMIT
+# keeps only the best `limit` rows while scanning). A 1-2 letter prefix on a 100k
+# catalog matches tens of thousands of rows and ranking all of them costs more than the
+# scan we are replacing: those rank only the first CANDIDATE_LIMIT matches, and the
+# next keystroke makes the query specific enough to rank exactly.
+# Sizes and pack counts ("500gr", "x24") are common and appear once per name, so bm25
+# barely orders them: a query made only of such tokens uses the cap as well. It is still
+# ~2x an ILIKE that stops at the first `limit` hits, the price of ranking at all.
+CANDIDATE_LIMIT = 500
+SHORT_TOKEN = 3 # tokens shorter than this use the candidate cap
+
+_SEARCH_SQL = f"""
+    SELECT catalog_items.* FROM (
+        SELECT {FTS_TABLE}.rowid AS item_id, bm25({FTS_TABLE}, 10.0, 2.0) AS score
+        FROM {FTS_TABLE}
+        JOIN catalog_items ON catalog_items.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :match
+          AND (catalog_items.is_pending = 0 OR catalog_items.is_pending IS NULL)
+        LIMIT :candidates
+    ) AS hits
+    JOIN catalog_items ON catalog_items.id = hits.item_id
+    ORDER BY hits.score, catalog_items.name
+    LIMIT :limit
+"""
+
+_fts_enabled = False
+
+def ensure_search_index(engine):
+    """Create the FTS table + sync triggers if missing. Backfills on first creation."""
+    global _fts_enabled
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"), {"n": FTS_TABLE}
+            ).first()
+            for stmt in _DDL:
+                conn.execute(text(stmt))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        _fts_enabled = True
+    except OperationalError as e:
+        # SQLite compiled without FTS5: search falls back to ILIKE
+        log.warning("FTS5 unavailable, catalog search will use ILIKE: %s", e)
+        _fts_enabled = False
+    return _fts_enabled
+
+def rebuild_search_index():
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    db.session.commit()
+
+def _tokens(query):
+    return re.findall(r'\w+', query.lower())
+
+def build_match_expression(query):
+    # Every word must match as a prefix: "cafe mol" -> "cafe"* AND "mol"*
+    # Quoting each token neutralizes FTS syntax chars typed by users (-, :, *, quotes).
+    return ' '.join(f'"{t}"*' for t in _tokens(query))
+
+def search_items(query, limit=30):
+    match = build_match_expression(query)
+    if not match:
+        return []
+
+    if not _fts_enabled:
+        return search_items_ilike(query, limit)
+
+    stmt = select(CatalogItem).from_statement(text(_SEARCH_SQL))
+    tokens = _tokens(query)
+    capped = any(len(t) < SHORT_TOKEN for t in tokens) or all(re.search(r'\d', t) for t in tokens)
+    # LIMIT -1: no cap, rank every match
+    candidates = CANDIDATE_LIMIT if capped else -1
+    items = db.session.execute(stmt, {"match": match, "candidates": candidates, "limit": limit}).scalars().all()
+
+    # The index only matches SKU prefixes: a one-word query also finds SKUs containing it
+    # ("0023" -> "10023") to fill the page
+    query = query.strip()
+    if len(items) < limit and not re.search(r'\s', query):
+        items += search_skus(query, limit - len(items), exclude={item.id for item in items})
+    return items
+
+def search_skus(fragment, limit, exclude=()):
+    return CatalogItem.query.filter(
+        CatalogItem.sku.contains(fragment, autoescape=True),
+        CatalogItem.id.notin_(exclude)
+    ).filter(
+        (CatalogItem.is_pending == False) | (CatalogItem.is_pending == None)
+    ).order_by(CatalogItem.sku).limit(limit).all()
+
+def search_items_ilike(query, limit=30):
+    # Legacy path (full table scan). Kept as fallback and as the benchmark baseline.
+    return CatalogItem.query.filter(
+        (CatalogItem.name.ilike(f'%{query}%')) |
+        (CatalogItem.sku.ilike(f'%{query}%'))
+    ).filter(
+        (CatalogItem.is_pending == False) | (CatalogItem.is_pending == None)
+    ).limit(limit).all()
@@ -0,0 +1,116 @@
+import time
+from datetime import datetime
+from sqlalchemy import select, insert, update
+from database import db
+from models import CatalogItem, Purchase, CostHistory
+from serializers import PURCHASE_LOAD_OPTIONS
+from provider_stats import StatsDelta
+
+# Purchase confirmation engine (single confirm + week-end batch confirm).
+#
+# - Drafts are loaded with their lines and provider in constant queries.
+# - All affected catalog items are read in one IN query; costs are replayed in
+#   purchase date order so two drafts touching the same item chain correctly.
+# - Catalog updates and CostHistory rows go out as executemany statements.
+# - Everything happens in the caller's transaction: one commit per request.
+
+IN_CHUNK = 900
+LOG_HEADER = ['purchase_id', 'date', 'provider', 'item_name', 'quantity', 'unit_cost', 'total_cost']
+
+def _chunks(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), IN_CHUNK):
+        yield ids[i:i + IN_CHUNK]
+
+def load_purchases(purchase_ids):
+    """Returns (purchases in confirmation order, missing ids)."""
+    wanted = set(purchase_ids)
+    purchases = []
+    for chunk in _chunks(wanted):
+        purchases.extend(
+            db.session.execute(
+                select(Purchase).options(*PURCHASE_LOAD_OPTIONS).where(Purchase.id.in_(chunk))
+            ).unique().scalars()
+        )
+    purchases.sort(key=lambda p: (p.date, p.id))
+    missing = sorted(wanted - {p.id for p in purchases})
+    return purchases, missing
+
+def confirm_purchases(purchases):
+    """
+    Confirm already-loaded draft purchases. Caller checks status and commits.
+    Returns a report dict.
+    """
+    t0 = time.perf_counter()
+    now = datetime.utcnow()
+
+    # 1. Current state of every affected item, one query per 900 ids
+    item_ids = {line.catalog_item_id for p in purchases for line in p.lines if line.catalog_item_id}
+    running_cost = {}
+    for chunk in _chunks(item_ids):
+        for iid, cost in db.session.execute(
+            select(CatalogItem.id, CatalogItem.current_cost).where(CatalogItem.id.in_(chunk))
+        ):
+            running_cost[iid] = cost or 0.0
+
+    # 2. Replay lines in order: cost updates + one history row per real change
+    history = []
+    stats = StatsDelta()
+    for purchase in purchases:
+        purchase.status = 'confirmed'
+        changes = 0
+        for line in purchase.lines:
+            if line.catalog_item_id not in running_cost:
+                continue
+            old_cost = running_cost[line.catalog_item_id]
+            new_cost = line.unit_cost
+            if abs(old_cost - new_cost) > 0.001:
+                history.append({
+                    "catalog_item_id": line.catalog_item_id,
+                    "provider_id": purchase.provider_id,
+                    "purchase_line_id": line.id,
+                    "old_cost": old_cost,
+                    "new_cost": new_cost,
+                    "changed_at": now
+                })
+                changes += 1
+            running_cost[line.catalog_item_id] = new_cost
+        stats.add_purchase(purchase.provider_id, purchase.total_amount, purchase.date,
+                           [l.catalog_item_name for l in purchase.lines])
+        stats.add_cost_changes(purchase.provider_id, changes)
+
+    # 3. Set-based writes. Confirming also promotes pending (ad-hoc) items.
+    db.session.flush() # purchase status
+    updates = [
+        {"id": iid, "current_cost": cost, "updated_at": now, "is_pending": False}
+        for iid, cost in running_cost.items()
+    ]
+    if updates:
+        db.session.execute(update(CatalogItem), updates)
+    if history:
+        db.session.execute(insert(CostHistory.__table__), history)
+    stats.apply()
+
+    return {
+        "confirmed": [p.id for p in purchases],
+        "count": len(purchases),
+        "items_updated": len(updates),
+        "cost_changes": len(history),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+def history_log_rows(purchases):
+    # Snapshot before commit: expire_on_commit would reload every purchase afterwards
+    rows = []
+    for purchase in purchases:
+        provider_name = purchase.provider.name if purchase.provider else "Unknown"
+        rows.extend([
+            purchase.id,
+            purchase.date.isoformat(),
+            provider_name,
+            line.catalog_item_name,
+            line.quantity,
+            line.unit_cost,
+            line.total_cost
+        ] for line in purchase.lines)
+    return rows
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, insert
 from sqlalchemy.orm import DeclarativeBase
 
 class Base(DeclarativeBase):
@@ -6,7 +7,98 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+# SQLite storage profiles, applied to every new DBAPI connection.
+# 'wal' is the default: readers never block on a writer (confirm_purchase), commits
+# only fsync the WAL, and concurrent workers wait (busy_timeout) instead of failing
+# with "database is locked".
+STORAGE_PROFILES = {
+    'default': {}, # SQLite defaults: rollback journal, synchronous=FULL
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,          # ms
+        'cache_size': -64000,          # 64MB (negative = KiB)
+        'mmap_size': 268435456,        # 256MB
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',         # fsync on every commit (power-loss safe)
+        'busy_timeout': 10000,
+        'cache_size': -64000,
+        'foreign_keys': 'ON',
+    },
+}
+
+# Pool sizing for multi-worker deployments: each gunicorn worker gets its own pool.
+# SQLite serializes writers anyway, so a small pool + busy_timeout beats many connections.
+DEFAULT_ENGINE_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 5,
+    'pool_timeout': 30,
+    'connect_args': {'timeout': 15, 'check_same_thread': False},
+}
+
+def sqlite_engine_options(uri, overrides=None):
+    if not uri.startswith('sqlite') or ':memory:' in uri or uri in ('sqlite://', 'sqlite:///'):
+        return dict(overrides or {})
+    options = dict(DEFAULT_ENGINE_OPTIONS)
+    options.update(overrides or {})
+    return options
+
+def apply_storage_profile(engine, profile_name):
+    if engine.dialect.name != 'sqlite':
+        return
+    if profile_name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile '{profile_name}'. Options: {', '.join(STORAGE_PROFILES)}")
+    pragmas = STORAGE_PROFILES[profile_name]
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for key, value in pragmas.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+        cursor.close()
+
+def insert_returning_ids(session, table, rows):
+    """
+    Multi-row INSERT ... RETURNING id; ids come back in the order of rows.
+    SQLite has no insertmanyvalues sentinel, so sort_by_parameter_order=True would send
+    one INSERT per row. Inside the write transaction new rowids are max(rowid) + 1 per
+    row, in VALUES order, so the sorted ids line up with the parameters.
+    """
+    if not rows:
+        return []
+    return sorted(rid for (rid,) in session.execute(insert(table).returning(table.c.id), rows))
+
 def init_db(app):
+    import models # registers the tables on db.metadata before create_all
     db.init_app(app)
     with app.app_context():
-        db.create_all()
+        apply_storage_profile(db.engine, app.config.get('SQLITE_PROFILE', 'wal'))
+        prepare_schema(db.engine)
+
+def prepare_schema(engine):
+    """Bring a database file up to the current schema (startup, and after a restore)."""
+    db.metadata.create_all(engine)
+
+    # Versioned schema changes for DBs created by older releases
+    from migrations import run_migrations
+    run_migrations(engine)
+
+    # Search index lives outside the ORM metadata (FTS5 virtual table + triggers)
+    from catalog_search import ensure_search_index
+    ensure_search_index(engine)
+
+    # Trigram index for provider dedup (FTS5 + triggers, see provider_dedup.py)
+    from provider_dedup import ensure_provider_index
+    ensure_provider_index(engine)
+
+    # Change feed for offline clients (change_log + triggers, see sync_feed.py)
+    from sync_feed import ensure_change_log
+    ensure_change_log(engine)
+
+    # Confirmed-purchase change log for incremental price series updates (price_series.py)
+    from price_series import ensure_series_log
+    ensure_series_log(engine)
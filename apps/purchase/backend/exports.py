@@ -0,0 +1,104 @@
+import csv
+import io
+from sqlalchemy import select
+from database import db
+from models import Provider, CatalogItem, Purchase, PurchaseLine
+from pagination import Keyset
+from serializers import PURCHASES_NEWEST_FIRST
+
+# Streaming CSV exports.
+# Rows are read in keyset batches (pagination.py): each batch is a short query that
+# seeks past the last row of the previous one, so memory stays flat, no read
+# transaction stays open for the whole download, and the download starts before the
+# whole history has been rendered.
+
+BATCH_SIZE = 1000 # catalog rows per query
+PURCHASE_BATCH = 500 # purchases (with all their lines) per query
+
+PURCHASES_HEADER = ['Fecha', 'Proveedor', 'Item', 'SKU', 'Cantidad', 'Unidad', 'Costo Unitario', 'Costo Total', 'Total Factura']
+# Header matching Loyverse as close as possible for re-import
+CATALOG_HEADER = ['Handle', 'SKU', 'Nombre', 'Categoria', 'Coste', 'Precio', 'Vendido por peso', 'Proveedor']
+
+# Rows are buffered into ~64KB chunks so the WSGI server is not handed one write per row
+CHUNK_SIZE = 64 * 1024
+
+def stream_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+def purchase_rows():
+    line_stmt = select(
+        Purchase.date,
+        Provider.name,
+        PurchaseLine.catalog_item_name,
+        CatalogItem.sku,
+        PurchaseLine.temp_sku,
+        PurchaseLine.quantity,
+        CatalogItem.default_unit,
+        PurchaseLine.unit_cost,
+        PurchaseLine.total_cost,
+        Purchase.total_amount
+    ).select_from(PurchaseLine).\
+        join(Purchase, PurchaseLine.purchase_id == Purchase.id).\
+        outerjoin(Provider, Purchase.provider_id == Provider.id).\
+        outerjoin(CatalogItem, PurchaseLine.catalog_item_id == CatalogItem.id).\
+        order_by(Purchase.date.desc(), Purchase.id.desc(), PurchaseLine.id)
+
+    after = None
+    while True:
+        keys = db.session.execute(
+            PURCHASES_NEWEST_FIRST.apply(select(Purchase.date, Purchase.id), after, PURCHASE_BATCH)
+        ).all()
+        if not keys:
+            return
+        stmt = line_stmt.where(Purchase.id.in_([pid for _, pid in keys]))
+        for date, prov_name, item_name, sku, temp_sku, qty, unit, unit_cost, total_cost, total_amount in db.session.execute(stmt):
+            yield [
+                date.strftime('%Y-%m-%d %H:%M') if date else '',
+                prov_name or "Desconocido",
+                item_name,
+                sku or temp_sku or '',
+                qty,
+                unit or 'und',
+                unit_cost,
+                total_cost,
+                total_amount
+            ]
+        if len(keys) < PURCHASE_BATCH:
+            return
+        after = tuple(keys[-1])
+
+def catalog_rows():
+    stmt = select(
+        CatalogItem.id,
+        CatalogItem.loyverse_id,
+        CatalogItem.sku,
+        CatalogItem.name,
+        CatalogItem.category_id,
+        CatalogItem.current_cost,
+        CatalogItem.is_by_weight
+    )
+
+    for item_id, loyverse_id, sku, name, category_id, cost, by_weight in Keyset(CatalogItem.id).batches(
+        stmt, key=lambda row: (row.id,), size=BATCH_SIZE
+    ):
+        yield [
+            loyverse_id or f"handle-{item_id}",
+            sku or "",
+            name,
+            category_id or "General",
+            cost,
+            0, # Price not tracked
+            'Y' if by_weight else 'N',
+            "" # Provider unknown/varied
+        ]
@@ -0,0 +1,16 @@
+from flask import current_app
+from werkzeug.local import LocalProxy
+from cache import ResponseCache
+
+# Objects shared by the views, bound to an app by create_app() (app.py).
+#
+# - cache exists at import time because views decorate with it (@cache.cached);
+#   create_app() picks its backend with cache.init_app(app).
+# - audit, instrumentation and the catalog read model are built per app and stored in app.extensions;
+#   these proxies resolve to the current app's objects inside a request or app
+#   context (no context: RuntimeError, like flask.current_app).
+
+cache = ResponseCache()
+audit = LocalProxy(lambda: current_app.extensions['audit_log'])
+instrumentation = LocalProxy(lambda: current_app.extensions['instrumentation'])
+catalog = LocalProxy(lambda: current_app.extensions['catalog'])
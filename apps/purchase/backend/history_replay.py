@@ -0,0 +1,176 @@
+import csv
+import io
+import time
+from datetime import datetime
+from sqlalchemy import select, insert, update, func
+from database import db, insert_returning_ids
+from models import Provider, CatalogItem, Purchase, PurchaseLine, CostHistory
+from provider_dedup import normalize_provider
+from provider_stats import StatsDelta
+
+# Purchase history replay (settings -> "Restaurar Historial").
+# Input is the flat CSV produced by /api/export/purchases:
+#   Fecha, Proveedor, Item, SKU, Cantidad, Unidad, Costo Unitario, Costo Total, Total Factura
+#
+# - The file is streamed; lines are grouped by (day, provider) into purchases.
+# - Providers and items are resolved through in-memory maps built with one query each.
+# - Groups are replayed in date order, so CostHistory rows chain old -> new correctly.
+#   current_cost takes the file's latest price only for items with no confirmed purchase
+#   on or after that day: replaying an old export never rolls back a newer price.
+# - Everything is written with executemany inserts inside the caller's transaction,
+#   including the provider_stats rollup.
+
+def _to_float(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def read_history(byte_stream):
+    """Stream-parse the CSV into {(day, normalized_provider): {"provider": name, "rows": [...]}}."""
+    groups = {}
+    text_stream = io.TextIOWrapper(byte_stream, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.DictReader(text_stream):
+            date_str = (row.get('Fecha') or '').split(' ')[0] # 2026-01-27
+            if not date_str:
+                continue
+            prov_name = (row.get('Proveedor') or 'General').strip() or 'General'
+            key = (date_str, normalize_provider(prov_name))
+
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {"provider": prov_name, "rows": []}
+            group["rows"].append((
+                (row.get('Item') or '').strip(),
+                _to_float(row.get('Cantidad')),
+                _to_float(row.get('Costo Unitario')),
+                _to_float(row.get('Costo Total')),
+            ))
+    finally:
+        text_stream.detach() # don't close the upload stream under werkzeug
+    return groups
+
+def replay_history(byte_stream):
+    timings = {}
+
+    t0 = time.perf_counter()
+    groups = read_history(byte_stream)
+    timings['parse'] = time.perf_counter() - t0
+
+    # 1. Lookup maps (one query each)
+    t0 = time.perf_counter()
+    providers = {}
+    for pid, name, normalized in db.session.execute(select(Provider.id, Provider.name, Provider.normalized_name)):
+        providers.setdefault(normalize_provider(name), pid)
+        if normalized:
+            providers.setdefault(normalized, pid)
+
+    items = {}
+    running_cost = {}
+    for iid, name, cost in db.session.execute(select(CatalogItem.id, CatalogItem.name, CatalogItem.current_cost)):
+        items.setdefault(name.strip().casefold(), iid)
+        running_cost[iid] = cost or 0.0
+
+    # Latest confirmed purchase per item, before the replayed ones land
+    latest_confirmed = dict(db.session.execute(
+        select(PurchaseLine.catalog_item_id, func.max(Purchase.date))
+        .join(Purchase, Purchase.id == PurchaseLine.purchase_id)
+        .where(Purchase.status == 'confirmed')
+        .group_by(PurchaseLine.catalog_item_id)
+    ).all())
+
+    # 2. Missing providers in one insert
+    missing = {}
+    for (_, normalized), group in groups.items():
+        if normalized not in providers:
+            missing.setdefault(normalized, group["provider"])
+    if missing:
+        rows = [{"name": name, "category": 'Importado', "normalized_name": normalized}
+                for normalized, name in missing.items()]
+        for row, new_id in zip(rows, insert_returning_ids(db.session, Provider.__table__, rows)):
+            providers[row["normalized_name"]] = new_id
+    timings['resolve'] = time.perf_counter() - t0
+
+    # 3. Purchase headers, chronological
+    t0 = time.perf_counter()
+    ordered = sorted(groups.items(), key=lambda kv: (kv[0][0], kv[1]["provider"]))
+    headers = []
+    for (date_str, normalized), group in ordered:
+        headers.append({
+            "provider_id": providers[normalized],
+            "total_amount": sum(r[3] for r in group["rows"]),
+            "status": 'confirmed', # Import as confirmed
+            "date": datetime.strptime(date_str, '%Y-%m-%d')
+        })
+    purchase_ids = insert_returning_ids(db.session, Purchase.__table__, headers)
+
+    # 4. Lines (unmatched items are skipped: catalog_item_id is mandatory)
+    lines = []
+    line_meta = [] # (item_id, provider_id, date) aligned with lines
+    unmatched = set()
+    for header, purchase_id, (_, group) in zip(headers, purchase_ids, ordered):
+        for item_name, qty, cost, total in group["rows"]:
+            item_id = items.get(item_name.casefold())
+            if item_id is None:
+                unmatched.add(item_name)
+                continue
+            lines.append({
+                "purchase_id": purchase_id,
+                "catalog_item_id": item_id,
+                "catalog_item_name": item_name,
+                "quantity": qty,
+                "unit_cost": cost,
+                "total_cost": total
+            })
+            line_meta.append((item_id, header["provider_id"], header["date"]))
+
+    line_ids = insert_returning_ids(db.session, PurchaseLine.__table__, lines)
+
+    # 5. Cost replay in date order: one CostHistory row per real change
+    history = []
+    touched = {} # item_id -> latest replayed date
+    for line, line_id, (item_id, provider_id, date) in zip(lines, line_ids, line_meta):
+        old_cost = running_cost.get(item_id, 0.0)
+        new_cost = line["unit_cost"]
+        touched[item_id] = date
+        if abs(old_cost - new_cost) > 0.001:
+            history.append({
+                "catalog_item_id": item_id,
+                "provider_id": provider_id,
+                "purchase_line_id": line_id,
+                "old_cost": old_cost,
+                "new_cost": new_cost,
+                "changed_at": date
+            })
+        running_cost[item_id] = new_cost
+
+    if history:
+        db.session.execute(insert(CostHistory.__table__), history)
+
+    newer = [iid for iid, date in touched.items() if iid not in latest_confirmed or date > latest_confirmed[iid]]
+    if newer:
+        db.session.execute(update(CatalogItem), [{"id": iid, "current_cost": running_cost[iid]} for iid in newer])
+
+    # 6. Provider rollup for the replayed purchases
+    stats = StatsDelta()
+    names_by_purchase = {}
+    for line in lines:
+        names_by_purchase.setdefault(line["purchase_id"], []).append(line["catalog_item_name"])
+    for header, purchase_id in zip(headers, purchase_ids):
+        stats.add_purchase(header["provider_id"], header["total_amount"], header["date"], names_by_purchase.get(purchase_id, []))
+    for row in history:
+        stats.add_cost_changes(row["provider_id"], 1)
+    stats.apply()
+    timings['write'] = time.perf_counter() - t0
+
+    return {
+        "purchases": len(purchase_ids),
+        "lines": len(line_ids),
+        "cost_changes": len(history),
+        "current_costs_updated": len(newer),
+        "providers_added": len(missing),
+        "unmatched_items": sorted(unmatched)[:50],
+        "unmatched_count": len(unmatched),
+        "timings_ms": {phase: round(secs * 1000, 1) for phase, secs in timings.items()},
+    }
@@ -0,0 +1,93 @@
+import functools
+import hashlib
+import json
+from datetime import datetime, timedelta
+from flask import request, g, current_app
+from sqlalchemy import select, delete, insert
+from database import db
+from models import IdempotencyKey
+
+# Idempotency-Key support for create endpoints (flaky mobile retries, offline sync).
+#
+#   @bp.route('/api/purchases', methods=['POST'])
+#   @idempotent('purchases.create')
+#   def create_purchase():
+#       ...
+#       record(body, 201)          # same transaction as the writes
+#       db.session.commit()
+#
+# - Same key + same body: the stored response is replayed (header Idempotent-Replayed).
+# - Same key + different body: 422, the key belongs to another request.
+# - Two concurrent requests with one key: the loser's commit hits the primary key,
+#   its view answers 500 and the decorator replays the winner's stored response.
+# - Keys expire after KEY_TTL (swept when new keys are recorded).
+
+KEY_TTL = timedelta(hours=24)
+MAX_KEY_LENGTH = 200
+
+def _request_hash():
+    try:
+        payload = json.dumps(request.get_json(silent=True), sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        payload = request.get_data(as_text=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _stored(endpoint, key):
+    return db.session.execute(
+        select(IdempotencyKey).where(IdempotencyKey.endpoint == endpoint, IdempotencyKey.key == key)
+    ).scalar_one_or_none()
+
+def _replay(entry):
+    response = current_app.response_class(entry.response, status=entry.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def record(body, status_code):
+    """Store the response for the current Idempotency-Key (no-op without a key). Call before commit."""
+    ctx = g.get('idempotency')
+    if ctx is None:
+        return
+    endpoint, key, request_hash = ctx
+    now = datetime.utcnow()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < now - KEY_TTL))
+    db.session.execute(insert(IdempotencyKey), [{
+        "endpoint": endpoint,
+        "key": key,
+        "request_hash": request_hash,
+        "status_code": status_code,
+        "response": json.dumps(body),
+        "created_at": now
+    }])
+
+def idempotent(endpoint):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return current_app.response_class(
+                    json.dumps({"error": f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters"}),
+                    status=400, mimetype='application/json')
+
+            request_hash = _request_hash()
+            entry = _stored(endpoint, key)
+            if entry is not None:
+                if entry.request_hash != request_hash:
+                    return current_app.response_class(
+                        json.dumps({"error": "Idempotency-Key already used with a different request"}),
+                        status=422, mimetype='application/json')
+                return _replay(entry)
+
+            g.idempotency = (endpoint, key, request_hash)
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code >= 500:
+                # Lost a race with a concurrent retry: answer with the winner's response
+                db.session.rollback()
+                entry = _stored(endpoint, key)
+                if entry is not None and entry.request_hash == request_hash:
+                    return _replay(entry)
+            return response
+        return wrapper
+    return decorator
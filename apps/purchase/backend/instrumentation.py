@@ -0,0 +1,210 @@
+import cProfile
+import glob
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from flask import g, request
+from sqlalchemy import event
+
+# Per-request instrumentation.
+#
+# - Flask before/after_request hooks time every request; SQLAlchemy cursor events
+#   count its statements, their time and the rows they return (SQLite: counted by a
+#   cursor row_factory, so fetched rows are counted exactly, not estimated).
+# - Every response carries a Server-Timing header (visible in the browser devtools):
+#       Server-Timing: app;dur=12.4, sql;dur=3.1;desc="5 queries, 120 rows"
+# - /metrics renders per-route histograms in Prometheus text format (per process:
+#   scrape each worker, or sum them).
+# - Sampled profiling: with PROFILE_EVERY=N one request in N runs under cProfile and
+#   the stats are dumped to PROFILE_DIR as .prof (pstats) files, which flameprof /
+#   snakeviz render as flame graphs. One profiled request at a time.
+# - Requests slower than SLOW_REQUEST_MS are logged with their SQL numbers.
+#
+# Streamed responses (CSV exports) are timed until the response starts, not until
+# the last byte.
+
+log = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+PROFILE_KEEP = 200 # newest .prof files kept in PROFILE_DIR
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets) # cumulative at render time
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = itertools.accumulate(self.counts)
+        for bound, count in zip(self.buckets, cumulative):
+            yield f'{name}_bucket{{{labels},le="{bound:g}"}} {count}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+# name -> (type, help, factory)
+METRICS = {
+    'purchase_http_request_duration_seconds': ('histogram', 'Wall time per request.', lambda: Histogram(DURATION_BUCKETS)),
+    'purchase_sql_queries_per_request': ('histogram', 'SQL statements per request.', lambda: Histogram(QUERY_BUCKETS)),
+    'purchase_sql_duration_seconds': ('histogram', 'Time spent in SQL per request.', lambda: Histogram(DURATION_BUCKETS)),
+    'purchase_sql_rows_total': ('counter', 'Rows returned by SQL statements.', int),
+    'purchase_http_requests_total': ('counter', 'Requests by status code.', int),
+}
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return ','.join(f'{k}="{_label(v)}"' for k, v in labels.items())
+
+class Instrumentation:
+    def __init__(self, profile_every=0, profile_dir=None, slow_request_ms=500):
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self.slow_request_ms = slow_request_ms
+        self._series = {name: {} for name in METRICS} # name -> {labels: value}
+        self._collectors = [] # (prefix, fn)
+        self._lock = threading.Lock()
+        self._local = threading.local() # request stats of the current thread
+        self._requests = itertools.count(1)
+        self._profiling = threading.Lock()
+
+    def init_app(self, app, engine):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._count_rows = engine.dialect.name == 'sqlite'
+
+    def add_collector(self, prefix, fn):
+        """Expose the numeric values of fn() (a stats dict) as gauges named <prefix>_<key>."""
+        self._collectors.append((prefix, fn))
+
+    # --- SQL ---
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            return
+        context._instrumentation_start = time.perf_counter()
+        if self._count_rows:
+            cursor.row_factory = stats['count_row']
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = getattr(self._local, 'stats', None)
+        start = getattr(context, '_instrumentation_start', None)
+        if stats is None or start is None:
+            return
+        stats['sql_time'] += time.perf_counter() - start
+        stats['queries'] += 1
+
+    # --- Requests ---
+
+    def _before_request(self):
+        stats = {'start': time.perf_counter(), 'queries': 0, 'sql_time': 0.0, 'rows': 0}
+
+        def count_row(cursor, row):
+            stats['rows'] += 1
+            return row
+        stats['count_row'] = count_row
+        self._local.stats = stats
+        g.instrumentation = stats
+        if self.profile_every and next(self._requests) % self.profile_every == 0 and self._profiling.acquire(blocking=False):
+            stats['profiler'] = cProfile.Profile()
+            stats['profiler'].enable()
+
+    def _after_request(self, response):
+        stats = g.get('instrumentation')
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats['start']
+        profiler = stats.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            self._profiling.release()
+            self._dump_profile(profiler, elapsed)
+
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        labels = _labels(method=request.method, route=route)
+        with self._lock:
+            self._observe('purchase_http_request_duration_seconds', labels, elapsed)
+            self._observe('purchase_sql_queries_per_request', labels, stats['queries'])
+            self._observe('purchase_sql_duration_seconds', labels, stats['sql_time'])
+            self._add('purchase_sql_rows_total', labels, stats['rows'])
+            self._add('purchase_http_requests_total', _labels(method=request.method, route=route, status=response.status_code), 1)
+
+        response.headers.add(
+            'Server-Timing',
+            f'app;dur={elapsed * 1000:.1f}, sql;dur={stats["sql_time"] * 1000:.1f};desc="{stats["queries"]} queries, {stats["rows"]} rows"'
+        )
+        if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+            log.warning("Slow request %s %s: %.0f ms, %d queries (%.0f ms), %d rows", request.method, request.full_path.rstrip('?'),
+                        elapsed * 1000, stats['queries'], stats['sql_time'] * 1000, stats['rows'])
+        return response
+
+    def _teardown_request(self, exc):
+        stats = g.get('instrumentation')
+        if stats is not None and stats.get('profiler') is not None:
+            # after_request never ran (unhandled error): stop profiling without a dump
+            stats.pop('profiler').disable()
+            self._profiling.release()
+        self._local.stats = None
+
+    def _observe(self, name, labels, value):
+        series = self._series[name]
+        if labels not in series:
+            series[labels] = METRICS[name][2]()
+        series[labels].observe(value)
+
+    def _add(self, name, labels, value):
+        series = self._series[name]
+        series[labels] = series.get(labels, 0) + value
+
+    # --- Profiles ---
+
+    def _dump_profile(self, profiler, elapsed):
+        if not self.profile_dir:
+            return
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+            name = f"{datetime.utcnow():%Y%m%d-%H%M%S-%f}-{request.method}-{slug}-{elapsed * 1000:.0f}ms.prof"
+            profiler.dump_stats(os.path.join(self.profile_dir, name))
+            for old in sorted(glob.glob(os.path.join(self.profile_dir, '*.prof')))[:-PROFILE_KEEP]:
+                os.remove(old)
+        except OSError as e:
+            log.warning("Could not write profile: %s", e)
+
+    # --- Exposition ---
+
+    def render(self):
+        """All metrics in Prometheus text format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, _) in METRICS.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in sorted(self._series[name].items()):
+                    if kind == 'histogram':
+                        lines.extend(value.samples(name, labels))
+                    else:
+                        lines.append(f"{name}{{{labels}}} {value}")
+        for prefix, fn in self._collectors:
+            for key, value in sorted(fn().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value}"]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,103 @@
+import argparse
+import sys
+
+# Maintenance CLI (one entry point instead of a script per task):
+#
+#   python manage.py migrate               # schema migrations (also run on every start)
+#   python manage.py seed [items.csv]      # catalog + providers from a Loyverse export
+#   python manage.py simulate              # demo purchases / cost history
+#   python manage.py rebuild-stats         # provider_stats rollup repair
+#   python manage.py price-series          # build / refresh the trend series file
+#   python manage.py prune-sync [days]     # drop old sync tombstones
+#   python manage.py backup                # compressed online snapshot into BACKUP_DIR (cron)
+#   python manage.py restore FILE          # validated restore from a .db / .db.gz
+#   python manage.py purge retention --older-than-months 24   # or transactions_only / full_wipe
+#
+# Commands run against create_app(web=False): same config and DB as the server, no
+# routes, audit writer or instrumentation. Each command imports only what it needs.
+
+def migrate(app, args):
+    from database import db
+    from migrations import run_migrations
+    print(f"Schema version: {run_migrations(db.engine)}")
+
+def seed(app, args):
+    from seed_db import seed_catalog_from_path
+    inserted, providers_added = seed_catalog_from_path(args.csv)
+    print(f"Seeded {inserted} items, {providers_added} new providers.")
+
+def simulate(app, args):
+    from simulate_data import simulate
+    simulate(app)
+
+def rebuild_stats(app, args):
+    from database import db
+    from provider_stats import rebuild_provider_stats
+    rebuild_provider_stats(db.session)
+    db.session.commit()
+    print("provider_stats rebuilt.")
+
+def price_series(app, args):
+    from price_series import get_store
+    store = get_store(app.config['PRICE_SERIES_DIR'])
+    print(f"price series: {len(store.data())} points in {store.directory}")
+
+def prune_sync(app, args):
+    from sync_feed import prune_tombstones
+    print(f"pruned {prune_tombstones(args.days)} tombstones older than {args.days} days")
+
+def backup(app, args):
+    from database import db
+    from backup import write_backup, prune_backups
+    path = write_backup(db.engine, app.config['BACKUP_DIR'])
+    prune_backups(app.config['BACKUP_DIR'], app.config['BACKUP_KEEP'])
+    print(f"backup written: {path}")
+
+def restore(app, args):
+    from database import db, prepare_schema
+    from backup import restore as restore_db
+    with open(args.file, 'rb') as fh:
+        saved = restore_db(db.engine, fh, app.config['BACKUP_DIR'])
+    prepare_schema(db.engine)
+    print(f"restored {args.file} (previous database saved as {saved})")
+
+def purge(app, args):
+    from database import db
+    from purge import start_purge, get_job
+    job_id = start_purge(db.engine, args.mode, args.older_than_months, background=False)
+    job = get_job(job_id)
+    print(f"purge {job['status']}: {job['progress']}" + (f" ({job['error']})" if job['error'] else ""))
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='manage.py', description='Enigma Purchase maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='apply pending schema migrations').set_defaults(run=migrate)
+    p = commands.add_parser('seed', help='load the catalog CSV (default ../data/items.csv)')
+    p.add_argument('csv', nargs='?')
+    p.set_defaults(run=seed)
+    commands.add_parser('simulate', help='generate demo purchases').set_defaults(run=simulate)
+    commands.add_parser('rebuild-stats', help='rebuild the provider_stats rollup').set_defaults(run=rebuild_stats)
+    commands.add_parser('price-series', help='build / refresh the price series file').set_defaults(run=price_series)
+    p = commands.add_parser('prune-sync', help='drop sync tombstones older than N days')
+    p.add_argument('days', nargs='?', type=int, default=90)
+    p.set_defaults(run=prune_sync)
+    commands.add_parser('backup', help='write a compressed snapshot to BACKUP_DIR').set_defaults(run=backup)
+    p = commands.add_parser('restore', help='replace the database with a .db / .db.gz backup')
+    p.add_argument('file')
+    p.set_defaults(run=restore)
+    p = commands.add_parser('purge', help='batched purge / retention (see purge.py)')
+    p.add_argument('mode', choices=['transactions_only', 'full_wipe', 'retention'])
+    p.add_argument('--older-than-months', type=int, help='retention: drop confirmed purchases older than this')
+    p.set_defaults(run=purge)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    from app import create_app
+    app = create_app(web=False)
+    with app.app_context():
+        args.run(app, args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import logging
+from sqlalchemy import text
+from database import db
+
+# Versioned schema migrations (replaces the ad-hoc migrate_vN.py / update_db.py scripts).
+# The applied version is stored in SQLite's PRAGMA user_version; init_db runs whatever is
+# pending right after create_all. Steps must be idempotent: on a fresh DB create_all has
+# already built the latest schema and the steps only need to notice that.
+
+log = logging.getLogger(__name__)
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+def _add_columns(conn, table, columns):
+    existing = _columns(conn, table)
+    for col_name, col_type in columns:
+        if col_name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_type}"))
+            log.info("Added column: %s.%s", table, col_name)
+
+def _v1_new_item_columns(conn):
+    # Was migrate_v2.py
+    _add_columns(conn, 'purchase_lines', [
+        ("is_new_item", "BOOLEAN DEFAULT 0"),
+        ("temp_category", "VARCHAR(100)"),
+        ("temp_sku", "VARCHAR(50)"),
+        ("temp_is_by_weight", "BOOLEAN DEFAULT 0")
+    ])
+
+def _v2_pending_items(conn):
+    # Was migrate_v3.py
+    _add_columns(conn, 'catalog_items', [("is_pending", "BOOLEAN DEFAULT 0")])
+
+def _v3_provider_contact(conn):
+    # Was update_db.py
+    _add_columns(conn, 'providers', [
+        ("address", "VARCHAR(200)"),
+        ("phone", "VARCHAR(50)"),
+        ("email", "VARCHAR(100)"),
+        ("notes", "VARCHAR(500)")
+    ])
+
+def _create_declared_indexes(conn):
+    # Indexes are declared once, in models.py (__table_args__)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+def _v4_index_pack(conn):
+    # Hot-path indexes (drafts, provider page, comparison, monitor) + planner statistics
+    _create_declared_indexes(conn)
+    conn.execute(text("ANALYZE"))
+
+def _v5_provider_stats(conn):
+    # Tables come from create_all; backfill the rollup from existing history
+    from provider_stats import rebuild_provider_stats
+    _create_declared_indexes(conn)
+    rebuild_provider_stats(conn)
+
+def _v6_pagination_indexes(conn):
+    # Keyset pagination of the provider directory (ix_providers_name)
+    _create_declared_indexes(conn)
+
+def _v7_incremental_vacuum(conn):
+    # Pages freed by purges go back to the OS with PRAGMA incremental_vacuum (purge.py).
+    # Switching auto_vacuum on an existing file needs one full VACUUM (outside a
+    # transaction: pysqlite only opens one before DML). Large DBs: expect a pause here.
+    # ix_cost_history_purchase_line: deleting a line checks cost_history (foreign_keys=ON)
+    _create_declared_indexes(conn)
+    if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+        conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+
+def _v8_renormalize_providers(conn):
+    # normalized_name keys from the old normalizer (lowercase, no dots/commas) are
+    # recomputed with provider_dedup.normalize_provider (accents, legal suffixes).
+    # Duplicates this uncovers are listed by GET /api/providers/duplicates, not merged.
+    from provider_dedup import normalize_provider
+    rows = []
+    for pid, name, old in conn.execute(text("SELECT id, name, normalized_name FROM providers")).all():
+        normalized = normalize_provider(name)
+        if normalized != old:
+            rows.append({"pid": pid, "normalized": normalized})
+    if rows:
+        conn.execute(text("UPDATE providers SET normalized_name = :normalized WHERE id = :pid"), rows)
+
+MIGRATIONS = [
+    (1, "purchase_lines new-item columns", _v1_new_item_columns),
+    (2, "catalog_items.is_pending", _v2_pending_items),
+    (3, "providers contact columns", _v3_provider_contact),
+    (4, "index pack for hot query paths", _v4_index_pack),
+    (5, "provider_stats rollup backfill", _v5_provider_stats),
+    (6, "indexes for keyset pagination", _v6_pagination_indexes),
+    (7, "incremental auto_vacuum, purge indexes", _v7_incremental_vacuum),
+    (8, "providers.normalized_name with the dedup normalizer", _v8_renormalize_providers),
+]
+
+def current_version(conn):
+    return conn.execute(text("PRAGMA user_version")).scalar() or 0
+
+def run_migrations(engine):
+    """Apply pending migrations, each in its own transaction. Returns the new version."""
+    with engine.connect() as conn:
+        version = current_version(conn)
+
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            log.info("Migrating schema to v%d: %s", number, description)
+            step(conn)
+            # PRAGMA can't take bound parameters; number is our own int
+            conn.execute(text(f"PRAGMA user_version = {int(number)}"))
+        version = number
+
+    return version
+
+if __name__ == "__main__":
+    # Same as: python manage.py migrate
+    import sys
+    from manage import main
+    sys.exit(main(['migrate']))
@@ -1,9 +1,14 @@
+import json
 from datetime import datetime
 from database import db
 
 # Providers: Who we buy from
 class Provider(db.Model):
     __tablename__ = 'providers'
+    __table_args__ = (
+        db.Index('ix_providers_normalized_name', 'normalized_name'), # duplicate detection / imports
+        db.Index('ix_providers_name', 'name'), # directory pages (keyset on name, id)
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     normalized_name = db.Column(db.String(100)) # For duplicate detection
@@ -31,6 +36,9 @@ class Provider(db.Model):
 # Catalog Items: The 'Memory' of what we can buy (Seeded from Loyverse, updated locally)
 class CatalogItem(db.Model):
     __tablename__ = 'catalog_items'
+    __table_args__ = (
+        db.Index('ix_catalog_items_updated_at', 'updated_at'), # price monitor (latest first)
+    )
     id = db.Column(db.Integer, primary_key=True)
     loyverse_id = db.Column(db.String(100), unique=True) # UUID from Loyverse, if available
     sku = db.Column(db.String(50))
@@ -59,6 +67,12 @@ class CatalogItem(db.Model):
 # Purchase Header: The Transaction
 class Purchase(db.Model):
     __tablename__ = 'purchases'
+    __table_args__ = (
+        db.Index('ix_purchases_status_date', 'status', 'date'), # drafts inbox/count, top providers
+        db.Index('ix_purchases_provider_status_date', 'provider_id', 'status', 'date'), # provider page metrics + history
+        db.Index('ix_purchases_provider_date', 'provider_id', 'date'), # provider history API (all statuses)
+        db.Index('ix_purchases_date', 'date'), # recent purchases, exports
+    )
     id = db.Column(db.Integer, primary_key=True)
     provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -86,6 +100,10 @@ class Purchase(db.Model):
 # Purchase Line: The details
 class PurchaseLine(db.Model):
     __tablename__ = 'purchase_lines'
+    __table_args__ = (
+        db.Index('ix_purchase_lines_purchase_item', 'purchase_id', 'catalog_item_id'), # lines of a purchase, top items
+        db.Index('ix_purchase_lines_item_purchase', 'catalog_item_id', 'purchase_id'), # price comparison per item
+    )
     id = db.Column(db.Integer, primary_key=True)
     purchase_id = db.Column(db.Integer, db.ForeignKey('purchases.id'), nullable=False)
     catalog_item_id = db.Column(db.Integer, db.ForeignKey('catalog_items.id'), nullable=False)
@@ -116,6 +134,11 @@ class PurchaseLine(db.Model):
 
 class CostHistory(db.Model):
     __tablename__ = 'cost_history'
+    __table_args__ = (
+        db.Index('ix_cost_history_provider', 'provider_id'), # provider volatility
+        db.Index('ix_cost_history_purchase_line', 'purchase_line_id'), # FK check when purges delete lines
+        db.Index('ix_cost_history_item_changed', 'catalog_item_id', 'changed_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     catalog_item_id = db.Column(db.Integer, db.ForeignKey('catalog_items.id'))
     provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'))
@@ -123,3 +146,73 @@ class CostHistory(db.Model):
     old_cost = db.Column(db.Float)
     new_cost = db.Column(db.Float)
     changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Provider analytics rollup (maintained incrementally by provider_stats.py)
+class ProviderStats(db.Model):
+    __tablename__ = 'provider_stats'
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), primary_key=True)
+    total_spend = db.Column(db.Float, nullable=False, default=0.0) # confirmed purchases only
+    purchase_count = db.Column(db.Integer, nullable=False, default=0)
+    volatility = db.Column(db.Integer, nullable=False, default=0) # CostHistory rows
+    last_purchase_date = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ProviderItemStats(db.Model):
+    __tablename__ = 'provider_item_stats'
+    __table_args__ = (
+        db.Index('ix_provider_item_stats_rank', 'provider_id', 'line_count'), # top-N per provider
+    )
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), primary_key=True)
+    catalog_item_name = db.Column(db.String(200), primary_key=True)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Audit entries committed with their confirmation, deleted once the log file is fsynced (audit_log.py)
+class AuditOutbox(db.Model):
+    __tablename__ = 'audit_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text, nullable=False) # JSON list, one log row
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Stored responses for Idempotency-Key retries (idempotency.py)
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.Index('ix_idempotency_keys_created_at', 'created_at'), # expiry sweep
+    )
+    endpoint = db.Column(db.String(100), primary_key=True)
+    key = db.Column(db.String(200), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Background purge / retention jobs (purge.py); progress is shared by every worker
+class PurgeJob(db.Model):
+    __tablename__ = 'purge_jobs'
+    __table_args__ = (
+        db.Index('ux_purge_jobs_running', 'status', unique=True, sqlite_where=db.text("status = 'running'")), # one purge at a time
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    mode = db.Column(db.String(20), nullable=False) # 'transactions_only', 'full_wipe', 'retention'
+    cutoff = db.Column(db.DateTime) # retention: confirmed purchases dated before this
+    status = db.Column(db.String(20), nullable=False, default='running') # 'running', 'done', 'failed'
+    phase = db.Column(db.String(50))
+    progress = db.Column(db.Text, nullable=False, default="{}") # JSON {table: rows deleted, pages_freed: n}
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow) # heartbeat, one per batch
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'cutoff': self.cutoff.isoformat() if self.cutoff else None,
+            'status': self.status,
+            'phase': self.phase,
+            'progress': json.loads(self.progress or '{}'),
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
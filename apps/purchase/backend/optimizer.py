@@ -0,0 +1,186 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from models import Provider
+from extensions import catalog
+from analytics import latest_price_rows
+
+# Shopping-list optimizer.
+# 1. Load the latest price of every (item, provider) pair in ONE windowed query.
+# 2. Pivot into an items x providers matrix (NaN = never bought there).
+# 3. Solve the assignment with array ops: cheapest effective price per row,
+#    then drop providers until the basket constraints hold.
+#
+# Constraints (all optional):
+#   quantities       {item_id: qty}          default 1 per item
+#   min_order        number or {provider_id: number}  basket total a provider needs to be worth a stop
+#   max_stops        max number of providers to visit
+#   staleness_weight penalty per 30 days of price age (0.1 => a 60 day old price counts +20%)
+
+NO_HISTORY_NAME = "Sin Historial (Est. Precio Actual)"
+
+def load_price_matrix(item_ids):
+    rows = latest_price_rows(item_ids)
+    df = pd.DataFrame(rows, columns=['item_id', 'provider_id', 'provider_name', 'unit_cost', 'date'])
+    if df.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    now = datetime.utcnow()
+    df['age_days'] = (now - pd.to_datetime(df['date'])).dt.days.clip(lower=0)
+
+    prices = df.pivot(index='item_id', columns='provider_id', values='unit_cost')
+    ages = df.pivot(index='item_id', columns='provider_id', values='age_days')
+    return prices, ages
+
+def optimize(item_ids, quantities=None, min_order=None, max_stops=None, staleness_weight=0.0):
+    """Returns (plan, warnings). warnings lists constraints that could not be met."""
+    item_ids = list(dict.fromkeys(item_ids)) # dedupe, keep order
+    if not item_ids:
+        return [], []
+
+    items = catalog.get_many(item_ids) # catalog_cache.py: name, current_cost
+    item_ids = [iid for iid in item_ids if iid in items]
+    quantities = quantities or {}
+    qty = np.array([float(quantities.get(iid, 1) or 1) for iid in item_ids])
+
+    prices, ages = load_price_matrix(item_ids)
+    prices = prices.reindex(index=item_ids)
+    ages = ages.reindex(index=item_ids)
+    provider_ids = [int(p) for p in prices.columns]
+
+    P = prices.to_numpy(dtype=float) if provider_ids else np.empty((len(item_ids), 0))
+    A = ages.to_numpy(dtype=float) if provider_ids else np.empty((len(item_ids), 0))
+
+    # Effective cost drives the choice, real cost drives min-order checks and totals
+    line_cost = P * qty[:, None]
+    effective = line_cost * (1 + staleness_weight * np.nan_to_num(A) / 30.0)
+    effective = np.where(np.isnan(effective), np.inf, effective)
+
+    min_orders = _min_order_vector(min_order, provider_ids)
+    assign, warnings = _solve(effective, line_cost, np.ones(len(provider_ids), dtype=bool), min_orders, max_stops)
+
+    plan = _build_plan(item_ids, items, qty, assign, P, A, provider_ids, min_orders)
+    return plan, sorted(warnings)
+
+def _solve(effective, line_cost, active, min_orders, max_stops, lookahead=True):
+    """Drop providers until the constraints hold. Returns (assign, warnings)."""
+    active = active.copy()
+    warnings = set()
+    while True:
+        assign, best = _assign(effective, active)
+        used = np.unique(assign[assign >= 0])
+
+        drop = None
+        if max_stops is not None and len(used) > max_stops:
+            drop = _cheapest_to_drop(effective, active, assign, best, used)
+            if drop is None:
+                warnings.add("max_stops")
+        if drop is None and min_orders is not None:
+            totals = _basket_totals(line_cost, assign, effective.shape[1])
+            short = [j for j in used if totals[j] < min_orders[j]]
+            droppable = [j for j in short if _removal_penalty(effective, active, assign, best, j) < np.inf]
+            if droppable and lookahead:
+                # Dropping one basket moves its items and can fill (or empty) the others:
+                # play each candidate out and keep the one that ends cheapest
+                drop = min(droppable, key=lambda j: _outcome(effective, line_cost, active, j, min_orders, max_stops))
+            elif droppable:
+                drop = min(droppable, key=lambda j: _removal_penalty(effective, active, assign, best, j))
+            elif short:
+                warnings.add("min_order")
+        if drop is None:
+            return assign, warnings
+        active[drop] = False
+
+def _outcome(effective, line_cost, active, j, min_orders, max_stops):
+    # (constraints missed, effective total) of the plan reached after dropping j
+    trial = active.copy()
+    trial[j] = False
+    assign, warnings = _solve(effective, line_cost, trial, min_orders, max_stops, lookahead=False)
+    has = assign >= 0
+    return len(warnings), float(effective[np.flatnonzero(has), assign[has]].sum())
+
+def _assign(effective, active):
+    # Cheapest active provider per item (-1 = never bought from an active provider)
+    if effective.shape[1] == 0:
+        return np.full(effective.shape[0], -1), np.full(effective.shape[0], np.inf)
+    masked = np.where(active[None, :], effective, np.inf)
+    assign = masked.argmin(axis=1)
+    best = masked[np.arange(len(assign)), assign]
+    assign = np.where(np.isinf(best), -1, assign)
+    return assign, best
+
+def _basket_totals(line_cost, assign, n_providers):
+    has = assign >= 0
+    chosen = line_cost[np.flatnonzero(has), assign[has]]
+    return np.bincount(assign[has], weights=chosen, minlength=n_providers)
+
+def _removal_penalty(effective, active, assign, best, j):
+    rows = assign == j
+    if not rows.any():
+        return 0.0
+    others = active.copy()
+    others[j] = False
+    alt = np.where(others[None, :], effective[rows], np.inf).min(axis=1)
+    return float((alt - best[rows]).sum())
+
+def _cheapest_to_drop(effective, active, assign, best, used):
+    penalties = [(_removal_penalty(effective, active, assign, best, j), j) for j in used]
+    penalty, j = min(penalties)
+    return j if penalty < np.inf else None
+
+def _min_order_vector(min_order, provider_ids):
+    if min_order is None:
+        return None
+    if isinstance(min_order, dict):
+        lookup = {int(k): float(v) for k, v in min_order.items()}
+        return np.array([lookup.get(pid, 0.0) for pid in provider_ids])
+    return np.full(len(provider_ids), float(min_order))
+
+def _build_plan(item_ids, items, qty, assign, P, A, provider_ids, min_orders):
+    providers = {}
+    if provider_ids:
+        providers = {p.id: p for p in Provider.query.filter(Provider.id.in_(provider_ids)).all()}
+
+    plan = {} # { provider_id: { name, items: [], total } }
+    for row, iid in enumerate(item_ids):
+        item = items[iid]
+        j = assign[row]
+        if j < 0:
+            # Fallback if never purchased: estimate with current cost
+            p_id, provider = 0, None
+            unit_cost = item.current_cost or 0.0
+            age = None
+        else:
+            p_id = provider_ids[j]
+            provider = providers.get(p_id)
+            unit_cost = float(P[row, j])
+            age = int(A[row, j])
+
+        if p_id not in plan:
+            plan[p_id] = {
+                "provider_id": p_id,
+                "provider_name": provider.name if provider else NO_HISTORY_NAME,
+                "provider_address": provider.address if provider else None,
+                "provider_phone": provider.phone if provider else None,
+                "items": [],
+                "total_est": 0
+            }
+            if j >= 0 and min_orders is not None:
+                plan[p_id]["min_order"] = float(min_orders[j])
+
+        est_cost = float(unit_cost * qty[row])
+        plan[p_id]['items'].append({
+            "id": iid,
+            "name": item.name,
+            "quantity": float(qty[row]),
+            "unit_cost": unit_cost,
+            "est_cost": est_cost,
+            "price_age_days": age
+        })
+        plan[p_id]['total_est'] += est_cost
+
+    for trip in plan.values():
+        if "min_order" in trip:
+            trip["below_min_order"] = bool(trip["total_est"] < trip["min_order"])
+
+    return list(plan.values())
@@ -0,0 +1,120 @@
+import base64
+import json
+from datetime import datetime
+from flask import request, url_for, jsonify
+from sqlalchemy import tuple_, and_
+from database import db
+
+# Keyset (seek) pagination for list endpoints and views.
+#
+#   PROVIDERS = Keyset(Provider.name, Provider.id)
+#   after, limit = parse_page_args(request.args)
+#   providers, cursor = PROVIDERS.fetch(select(Provider), after, limit, key=lambda p: (p.name, p.id))
+#   return paginated_json([p.to_dict() for p in providers], cursor)
+#
+# - Pages continue after the last row seen: WHERE (name, id) > (:name, :id) ORDER BY
+#   name, id LIMIT n+1 walks the index from that point, so page 500 costs what page 1
+#   costs (OFFSET would read and discard every row before it).
+# - Cursors are opaque (urlsafe base64 of the key values); clients only pass them back.
+# - Every page is capped (MAX_LIMIT): no request can pull a whole table into memory.
+# - JSON lists keep their array body; the next page travels in a Link: <...>; rel="next"
+#   header (and X-Next-Cursor), absent on the last page.
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+def encode_cursor(values):
+    raw = json.dumps([{"$dt": v.isoformat()} if isinstance(v, datetime) else v for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list):
+            raise ValueError
+        return tuple(datetime.fromisoformat(v["$dt"]) if isinstance(v, dict) else v for v in values)
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+
+def parse_page_args(args, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """?cursor=...&limit=N -> (key values or None, limit). Raises ValueError."""
+    cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+    limit = int(args.get('limit', default))
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return cursor, min(limit, maximum)
+
+class Keyset:
+    """
+    Sort key for seek pagination: the columns, in order, ending with a unique one (id).
+    nullable_first: the first column may be NULL (descending only: SQLite sorts NULL
+    lowest, so the NULL block is the tail of the list).
+    """
+
+    def __init__(self, *columns, descending=False, nullable_first=False):
+        if nullable_first and not descending:
+            raise ValueError("nullable_first needs a descending key")
+        self.columns = columns
+        self.descending = descending
+        self.nullable_first = nullable_first
+
+    def _past(self, columns, values):
+        return tuple_(*columns) < tuple_(*values) if self.descending else tuple_(*columns) > tuple_(*values)
+
+    def _after(self, values):
+        if len(values) != len(self.columns):
+            raise ValueError("Invalid cursor")
+        if self.nullable_first and values[0] is None:
+            return and_(self.columns[0].is_(None), self._past(self.columns[1:], values[1:]))
+        # Stops at the NULL block; an OR IS NULL here would turn the seek into a scan (see fetch)
+        return self._past(self.columns, values)
+
+    def apply(self, stmt, after=None, limit=None):
+        """Filter past the cursor, order by the key, LIMIT (pass limit + 1 to detect a next page)."""
+        if after is not None:
+            stmt = stmt.where(self._after(after))
+        stmt = stmt.order_by(*(c.desc() if self.descending else c.asc() for c in self.columns))
+        return stmt.limit(limit) if limit is not None else stmt
+
+    def page(self, rows, limit, key):
+        """Rows fetched with limit + 1 -> (rows[:limit], next cursor or None)."""
+        rows = list(rows)
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(key(rows[-1]))
+
+    def fetch(self, stmt, after, limit, key):
+        """One page of ORM entities for select(Model): (rows, next cursor or None)."""
+        rows = db.session.execute(self.apply(stmt, after, limit + 1)).scalars().all()
+        if self.nullable_first and after is not None and after[0] is not None and len(rows) <= limit:
+            # The seek ran out of non-NULL keys: continue into the NULL block
+            tail = self.apply(stmt.where(self.columns[0].is_(None)), None, limit + 1 - len(rows))
+            rows += db.session.execute(tail).scalars().all()
+        return self.page(rows, limit, key)
+
+    def batches(self, stmt, key, size=1000):
+        """Iterate a whole result in keyset batches (exports): one short query per batch."""
+        after = None
+        while True:
+            rows = db.session.execute(self.apply(stmt, after, size)).all()
+            yield from rows
+            if len(rows) < size:
+                return
+            after = key(rows[-1])
+
+def next_url(cursor):
+    """URL of the current endpoint with ?cursor= replaced (None on the last page)."""
+    if cursor is None:
+        return None
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+def paginated_json(items, cursor):
+    response = jsonify(items)
+    if cursor is not None:
+        response.headers['Link'] = f'<{next_url(cursor)}>; rel="next"'
+        response.headers['X-Next-Cursor'] = cursor
+    return response
@@ -0,0 +1,324 @@
+import glob
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from sqlalchemy import select, text
+from database import db
+from models import Provider, Purchase, PurchaseLine
+
+# Unit-cost time series per (item, provider), from confirmed purchases.
+#
+# All points live in ONE structured NumPy array sorted by (item, provider, ts) and
+# persisted as price_series-v<format>-<epoch>-<version>.npy, loaded with mmap_mode='r':
+# workers share the page cache and an item's slice is found with two binary searches.
+#
+# - series_changes gets one row per confirmed purchase whose points may have changed
+#   (confirm, unconfirm, line edits, date / provider re-points, deletes), written by
+#   triggers with a new AUTOINCREMENT version. Drafts never touch it, so creating and
+#   reviewing a draft leaves the series alone.
+# - The fingerprint is (sync epoch, newest version): one primary-key read.
+# - On a change, only the purchases logged after the loaded version are re-read (one
+#   IN query on purchase_id) and spliced into the array: their old points go, their
+#   current confirmed points come in. A full ordered scan of the lines table happens
+#   only without a base (first start, new epoch after a restore) or when more than
+#   RELOAD_OVER purchases changed at once.
+
+SERIES_DTYPE = np.dtype([('item', '<i4'), ('provider', '<i4'), ('ts', '<i8'), ('cost', '<f8'), ('purchase', '<i4')])
+FORMAT_VERSION = 3 # bump when SERIES_DTYPE or the file naming changes
+DAY = 86400
+RELOAD_OVER = 5000 # changed purchases beyond which a full rebuild is cheaper
+IN_CHUNK = 900
+
+_DDL = [
+    """CREATE TABLE IF NOT EXISTS series_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        purchase_id INTEGER NOT NULL UNIQUE
+    )""",
+    # Header changes that move points: status in or out of 'confirmed', date, provider
+    """CREATE TRIGGER IF NOT EXISTS purchases_series_ai AFTER INSERT ON purchases WHEN new.status = 'confirmed' BEGIN
+        INSERT OR REPLACE INTO series_changes (purchase_id) VALUES (new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS purchases_series_au AFTER UPDATE OF status, date, provider_id ON purchases
+    WHEN old.status = 'confirmed' OR new.status = 'confirmed' BEGIN
+        INSERT OR REPLACE INTO series_changes (purchase_id) VALUES (new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS purchases_series_ad AFTER DELETE ON purchases WHEN old.status = 'confirmed' BEGIN
+        INSERT OR REPLACE INTO series_changes (purchase_id) VALUES (old.id);
+    END""",
+]
+for _event, _ref, _of in (('INSERT', 'new', ''), ('UPDATE', 'new', ' OF catalog_item_id, unit_cost'), ('DELETE', 'old', '')):
+    # Lines of confirmed purchases only (confirming a draft logs the header above)
+    _DDL.append(f"""CREATE TRIGGER IF NOT EXISTS purchase_lines_series_a{_event[0].lower()} AFTER {_event}{_of} ON purchase_lines
+    WHEN EXISTS (SELECT 1 FROM purchases WHERE id = {_ref}.purchase_id AND status = 'confirmed') BEGIN
+        INSERT OR REPLACE INTO series_changes (purchase_id) VALUES ({_ref}.purchase_id);
+    END""")
+
+def ensure_series_log(engine):
+    """Create series_changes + triggers if missing (needs sync_meta, see sync_feed.py)."""
+    with engine.begin() as conn:
+        for stmt in _DDL:
+            conn.execute(text(stmt))
+
+def _fingerprint():
+    epoch, version = db.session.execute(text(
+        "SELECT (SELECT value FROM sync_meta WHERE key = 'epoch'), (SELECT MAX(version) FROM series_changes)"
+    )).one()
+    return epoch, version or 0
+
+def _to_ts(dt):
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+def _to_date(ts):
+    return datetime.fromtimestamp(int(ts), tz=timezone.utc).replace(tzinfo=None)
+
+def build_series(purchase_ids=None):
+    """Points of every confirmed purchase, or of the given ones, sorted."""
+    stmt = select(PurchaseLine.catalog_item_id, Purchase.provider_id, Purchase.date, PurchaseLine.unit_cost, Purchase.id).\
+        join(Purchase, PurchaseLine.purchase_id == Purchase.id).\
+        where(Purchase.status == 'confirmed', PurchaseLine.catalog_item_id.isnot(None)).\
+        order_by(PurchaseLine.catalog_item_id, Purchase.provider_id, Purchase.date, PurchaseLine.id)
+    if purchase_ids is None:
+        chunks = [db.session.execute(stmt.execution_options(yield_per=5000))]
+    else:
+        ids = sorted(purchase_ids)
+        chunks = [db.session.execute(stmt.where(PurchaseLine.purchase_id.in_(ids[i:i + IN_CHUNK])))
+                  for i in range(0, len(ids), IN_CHUNK)]
+    return np.fromiter(
+        ((item, provider or 0, _to_ts(date), cost or 0.0, pid)
+         for rows in chunks for item, provider, date, cost, pid in rows),
+        dtype=SERIES_DTYPE
+    )
+
+def splice(base, purchase_ids, points):
+    """base without the points of purchase_ids, plus points; still sorted by (item, provider, ts)."""
+    kept = base[~np.isin(base['purchase'], np.fromiter(purchase_ids, dtype=np.int64))]
+    merged = np.concatenate((np.asarray(kept), points))
+    # lexsort is stable: equal keys keep base order, new points after old ones
+    return merged[np.lexsort((merged['ts'], merged['provider'], merged['item']))]
+
+class PriceSeriesStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._data = None
+        self.stats = {"builds": 0, "updates": 0, "reloaded_purchases": 0}
+
+    def data(self):
+        """The current series array (memory-mapped), brought up to date if purchases changed."""
+        fingerprint = _fingerprint()
+        if fingerprint == self._fingerprint:
+            return self._data
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._data = self._load_or_update(fingerprint)
+                self._fingerprint = fingerprint
+        return self._data
+
+    def _path(self, epoch, version):
+        return os.path.join(self.directory, f"price_series-v{FORMAT_VERSION}-{epoch}-{version}.npy")
+
+    def _files(self, epoch):
+        # {version: path} of this epoch's files on disk
+        prefix = f"price_series-v{FORMAT_VERSION}-{epoch}-"
+        found = {}
+        for path in glob.glob(os.path.join(self.directory, prefix + '*.npy')):
+            version = os.path.basename(path)[len(prefix):-len('.npy')]
+            if version.isdigit():
+                found[int(version)] = path
+        return found
+
+    def _base(self, epoch, version):
+        # Newest known state older than version: our own array, else another worker's file
+        if self._fingerprint is not None and self._fingerprint[0] == epoch and self._fingerprint[1] < version:
+            return self._fingerprint[1], self._data
+        files = self._files(epoch)
+        older = [v for v in files if v < version]
+        if older:
+            try:
+                return max(older), np.load(files[max(older)], mmap_mode='r')
+            except (OSError, KeyError, ValueError):
+                pass # removed under us: rebuild
+        return None, None
+
+    def _load_or_update(self, fingerprint):
+        epoch, version = fingerprint
+        path = self._path(epoch, version)
+        if os.path.exists(path):
+            try:
+                return np.load(path, mmap_mode='r')
+            except OSError:
+                pass
+
+        base_version, base = self._base(epoch, version)
+        changed = None
+        if base is not None:
+            changed = db.session.execute(text(
+                "SELECT purchase_id FROM series_changes WHERE version > :seen LIMIT :cap"
+            ), {"seen": base_version, "cap": RELOAD_OVER + 1}).scalars().all()
+        if changed is None or len(changed) > RELOAD_OVER:
+            series = build_series()
+            self.stats["builds"] += 1
+        else:
+            series = splice(base, changed, build_series(changed))
+            self.stats["updates"] += 1
+            self.stats["reloaded_purchases"] += len(changed)
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, series)
+        os.replace(tmp, path) # other workers see the whole file or none
+        # Older states and other epochs go; a newer file from another worker stays
+        newer = {p for v, p in self._files(epoch).items() if v >= version}
+        for old in glob.glob(os.path.join(self.directory, 'price_series-*.npy')):
+            if old not in newer:
+                try:
+                    os.remove(old) # open mmaps keep working on POSIX
+                except OSError:
+                    pass
+        return np.load(path, mmap_mode='r')
+
+    def invalidate(self):
+        """Forget the loaded series and drop its files: the next read rebuilds from the rows."""
+        with self._lock:
+            self._fingerprint = None
+            self._data = None
+            for path in glob.glob(os.path.join(self.directory, 'price_series-*.npy')):
+                try:
+                    os.remove(path) # open mmaps keep working on POSIX
+                except OSError:
+                    pass
+
+    def item_slice(self, item_id):
+        data = self.data()
+        items = data['item']
+        lo = np.searchsorted(items, item_id, side='left')
+        hi = np.searchsorted(items, item_id, side='right')
+        return np.asarray(data[lo:hi]) # copy out of the map, slices are small
+
+    def items_points(self, item_ids):
+        """All points of many items in one gather (two vectorized binary searches)."""
+        data = self.data()
+        ids = np.asarray(sorted(item_ids), dtype=np.int64)
+        lo = np.searchsorted(data['item'], ids, side='left')
+        hi = np.searchsorted(data['item'], ids, side='right')
+        counts = hi - lo
+        if not counts.sum():
+            return np.empty(0, dtype=SERIES_DTYPE)
+        # concatenated aranges lo..hi without a Python loop
+        index = np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts) + np.arange(counts.sum())
+        return data[index] # fancy indexing copies out of the map
+
+_stores = {}
+
+def get_store(directory):
+    store = _stores.get(directory)
+    if store is None:
+        store = _stores.setdefault(directory, PriceSeriesStore(directory))
+    return store
+
+def invalidate_series():
+    """After bulk history rewrites (purge, provider merge): rebuild on the next read in this
+    process, whatever the fingerprint says. Other workers follow through the fingerprint."""
+    for store in list(_stores.values()):
+        store.invalidate()
+
+def rolling_mean(ts, values, window_days):
+    """Time-based rolling mean: average of the points in (t - window, t]. O(n)."""
+    if not len(values):
+        return values
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    start = np.searchsorted(ts, ts - window_days * DAY, side='right')
+    end = np.arange(1, len(values) + 1)
+    return (csum[end] - csum[start]) / (end - start)
+
+def summarize(values):
+    if not len(values):
+        return {"count": 0, "min": None, "max": None, "avg": None, "first": None, "last": None, "pct_change": None}
+    first, last = float(values[0]), float(values[-1])
+    return {
+        "count": int(len(values)),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "avg": float(values.mean()),
+        "first": first,
+        "last": last,
+        "pct_change": round((last - first) / first * 100, 2) if first else None
+    }
+
+def item_trend(directory, item_id, start=None, end=None, rolling_days=30):
+    """
+    Per-provider series for one item between start and end (datetimes, None = open),
+    with a rolling average (computed over the full history so the window edge is right),
+    min/max/avg and percent change inside the window.
+    """
+    points = get_store(directory).item_slice(item_id)
+    lo_ts = _to_ts(start) if start else None
+    hi_ts = _to_ts(end) if end else None
+
+    providers = []
+    overall = []
+    provider_ids = np.unique(points['provider']) if len(points) else []
+    names = dict(db.session.execute(
+        select(Provider.id, Provider.name).where(Provider.id.in_([int(p) for p in provider_ids]))
+    ).all()) if len(provider_ids) else {}
+
+    for provider_id in provider_ids:
+        series = points[points['provider'] == provider_id]
+        ts, cost = series['ts'], series['cost']
+        avg = rolling_mean(ts, cost, rolling_days)
+
+        mask = np.ones(len(ts), dtype=bool)
+        if lo_ts is not None:
+            mask &= ts >= lo_ts
+        if hi_ts is not None:
+            mask &= ts <= hi_ts
+        if not mask.any():
+            continue
+        ts, cost, avg = ts[mask], cost[mask], avg[mask]
+        overall.append(series[mask])
+
+        entry = {"provider_id": int(provider_id), "name": names.get(int(provider_id), "Unknown")}
+        entry.update(summarize(cost))
+        entry["points"] = [
+            {"date": _to_date(t).isoformat(), "unit_cost": float(c), "rolling_avg": round(float(a), 4)}
+            for t, c, a in zip(ts, cost, avg)
+        ]
+        providers.append(entry)
+
+    combined = np.sort(np.concatenate(overall), order='ts') if overall else np.empty(0, dtype=SERIES_DTYPE)
+    return {
+        "item_id": item_id,
+        "from": start.isoformat() if start else None,
+        "to": end.isoformat() if end else None,
+        "rolling_days": rolling_days,
+        "overall": summarize(combined['cost']),
+        "providers": providers
+    }
+
+def parse_trend_args(args, now=None):
+    """?days=365|all or ?from=YYYY-MM-DD&to=YYYY-MM-DD, ?rolling=30 -> (start, end, rolling_days). Raises ValueError."""
+    now = now or datetime.utcnow()
+    start = end = None
+    if args.get('from') or args.get('to'):
+        start = datetime.fromisoformat(args['from']) if args.get('from') else None
+        end = datetime.fromisoformat(args['to']) + timedelta(days=1) - timedelta(seconds=1) if args.get('to') else None
+    else:
+        days = args.get('days', '365')
+        if days != 'all':
+            days = int(days)
+            if days <= 0:
+                raise ValueError("days must be positive or 'all'")
+            start = now - timedelta(days=days)
+    rolling_days = int(args.get('rolling', 30))
+    if rolling_days <= 0:
+        raise ValueError("rolling must be a positive number of days")
+    return start, end, rolling_days
+
+if __name__ == "__main__":
+    # Same as: python manage.py price-series
+    import sys
+    from manage import main
+    sys.exit(main(['price-series']))
@@ -0,0 +1,233 @@
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter
+from sqlalchemy import select, text, bindparam
+from sqlalchemy.exc import OperationalError
+from database import db
+from models import Provider
+
+# Provider deduplication.
+#
+# - normalize_provider(): the key stored in providers.normalized_name and used for exact
+#   matches everywhere (create_provider, catalog seed, history replay). Accents, case,
+#   punctuation and legal suffixes go: "Verduras B.O", "Verduras BO S.A." and
+#   "VERDURAS B. O., S.A. de C.V." are all "verduras bo".
+# - Near duplicates ("Distribuidora Macro" / "Distribuidor Macro") are found by trigram
+#   similarity (Jaccard over per-word trigrams, as pg_trgm). Blocking keeps it
+#   sub-linear: only providers sharing a trigram with the name are ever scored.
+#   Single lookups go through an FTS5 trigram index over normalized_name (external
+#   content, triggers keep it in sync with any write, as catalog_search.py); the
+#   duplicate report builds a prefix-filtered trigram index in memory from one query.
+# - merge_providers() folds duplicates into one provider with set-based UPDATEs
+#   (purchases, cost history), rebuilds the target's rollup rows and deletes the rest,
+#   inside the caller's transaction.
+
+log = logging.getLogger(__name__)
+
+FTS_TABLE = 'providers_fts'
+
+SIMILAR_AT = 0.6 # trigram similarity reported as a possible duplicate
+CANDIDATE_LIMIT = 50 # FTS hits scored per lookup (best bm25 first)
+
+# Trailing tokens dropped by the normalizer ("s de rl" -> "", "perez y cia" -> "perez")
+LEGAL_SUFFIXES = {
+    'sa', 'sas', 'saa', 'sac', 'srl', 'rl', 'sl', 'slu', 'ltda', 'ltd', 'limitada', 'cia', 'ca', 'cv',
+    'sc', 'spa', 'eirl', 'inc', 'llc', 'corp', 'co', 'gmbh', 's',
+}
+_CONNECTORS = {'de', 'y'}
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        normalized_name, content='providers', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS providers_fts_ai AFTER INSERT ON providers BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, normalized_name) VALUES (new.id, new.normalized_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS providers_fts_ad AFTER DELETE ON providers BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, normalized_name) VALUES ('delete', old.id, old.normalized_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS providers_fts_au AFTER UPDATE OF normalized_name ON providers BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, normalized_name) VALUES ('delete', old.id, old.normalized_name);
+        INSERT INTO {FTS_TABLE}(rowid, normalized_name) VALUES (new.id, new.normalized_name);
+    END""",
+]
+
+_fts_enabled = False
+
+# --- Normalization ---
+
+def normalize_provider(name):
+    text_ = unicodedata.normalize('NFKD', name or '')
+    text_ = ''.join(c for c in text_ if not unicodedata.combining(c)).casefold().replace('&', ' y ')
+    # Dots and commas inside a word join it ("b.o" -> "bo", "s.a." -> "sa"), other punctuation splits
+    words = re.findall(r'[^\W_]+', re.sub(r'[.,\']', '', text_))
+
+    # Initials written apart are one word: "b o" -> "bo", "s. a." -> "sa"
+    tokens = []
+    for word in words:
+        if len(word) == 1 and tokens and tokens[-1][1]:
+            tokens[-1] = (tokens[-1][0] + word, True)
+        else:
+            tokens.append((word, len(word) == 1))
+    tokens = [t for t, _ in tokens]
+
+    end = len(tokens)
+    while end > 1 and tokens[end - 1] in LEGAL_SUFFIXES:
+        end -= 1
+        while end > 1 and tokens[end - 1] in _CONNECTORS:
+            end -= 1
+    return ' '.join(tokens[:end])
+
+def trigrams(normalized):
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def similarity(a, b):
+    """Trigram Jaccard similarity of two normalized names (0..1)."""
+    ga, gb = trigrams(a), trigrams(b)
+    if not ga or not gb:
+        return 1.0 if a == b else 0.0
+    return len(ga & gb) / len(ga | gb)
+
+# --- Index ---
+
+def ensure_provider_index(engine):
+    """Create the trigram FTS table + sync triggers if missing. Backfills on first creation."""
+    global _fts_enabled
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"), {"n": FTS_TABLE}
+            ).first()
+            for stmt in _DDL:
+                conn.execute(text(stmt))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        _fts_enabled = True
+    except OperationalError as e:
+        # SQLite older than 3.34 has no trigram tokenizer: lookups scan providers
+        log.warning("FTS5 trigram tokenizer unavailable, provider dedup will scan: %s", e)
+        _fts_enabled = False
+    return _fts_enabled
+
+def _candidates(normalized):
+    if not _fts_enabled:
+        return db.session.execute(select(Provider.id, Provider.normalized_name)).all()
+    # Raw trigrams of the indexed string; any shared one makes a candidate
+    grams = {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+    if not grams:
+        return db.session.execute(
+            select(Provider.id, Provider.normalized_name).where(Provider.normalized_name == normalized)
+        ).all()
+    return db.session.execute(text(
+        f"SELECT rowid, normalized_name FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+        f"ORDER BY rank LIMIT {CANDIDATE_LIMIT}"
+    ), {"match": ' OR '.join(f'"{g}"' for g in sorted(grams))}).all()
+
+def find_similar(name, threshold=SIMILAR_AT, exclude=()):
+    """Providers whose normalized name is similar to name: [(Provider, score)], best first."""
+    normalized = normalize_provider(name)
+    scored = {}
+    for pid, other in _candidates(normalized):
+        if pid in exclude or other is None:
+            continue
+        score = similarity(normalized, other)
+        if score >= threshold:
+            scored[pid] = score
+    if not scored:
+        return []
+    providers = db.session.execute(select(Provider).where(Provider.id.in_(scored))).scalars().all()
+    return sorted(((p, round(scored[p.id], 3)) for p in providers), key=lambda ps: (-ps[1], ps[0].id))
+
+def duplicate_groups(threshold=SIMILAR_AT):
+    """
+    Clusters of likely duplicates over the whole directory (one query, in-memory blocking).
+    Returns [[{id, name, normalized_name, score}, ...], ...], largest groups first.
+    """
+    rows = db.session.execute(select(Provider.id, Provider.name, Provider.normalized_name).order_by(Provider.id)).all()
+    names = {pid: normalized or normalize_provider(name) for pid, name, normalized in rows}
+    grams = {pid: trigrams(n) for pid, n in names.items()}
+
+    # Prefix filtering: with trigrams ordered rarest first, two names at Jaccard >= threshold
+    # share one of the first len - ceil(threshold * len) + 1 trigrams of each. Only those are
+    # indexed, so common trigrams ("  d" of every "distribuidora") never produce candidates.
+    df = Counter(g for gs in grams.values() for g in gs)
+    postings = {}
+    parent = {pid: pid for pid in names}
+    def root(pid):
+        while parent[pid] != pid:
+            parent[pid] = parent[parent[pid]]
+            pid = parent[pid]
+        return pid
+
+    best = {}
+    for pid, gs in grams.items():
+        size = len(gs)
+        prefix = sorted(gs, key=lambda g: (df[g], g))[:size - math.ceil(threshold * size) + 1]
+        seen = set()
+        for g in prefix:
+            seen.update(postings.get(g, ()))
+        for other in seen:
+            og = grams[other]
+            if threshold * size > len(og) or threshold * len(og) > size:
+                continue # sizes too far apart to reach the threshold
+            score = len(gs & og) / len(gs | og)
+            if score >= threshold:
+                parent[root(other)] = root(pid)
+                for p in (pid, other):
+                    best[p] = max(best.get(p, 0.0), score)
+        for g in prefix:
+            postings.setdefault(g, []).append(pid)
+
+    clusters = {}
+    for pid, name, _ in rows:
+        if pid in best:
+            clusters.setdefault(root(pid), []).append(
+                {"id": pid, "name": name, "normalized_name": names[pid], "score": round(best[pid], 3)}
+            )
+    return sorted(clusters.values(), key=lambda g: (-len(g), g[0]["id"]))
+
+# --- Merge ---
+
+def merge_providers(session, target_id, source_ids):
+    """
+    Fold source_ids into target_id: purchases and cost history are re-pointed, empty
+    contact fields are filled from the sources, the rollup is rebuilt for the target
+    and the sources are deleted. Runs in the caller's transaction.
+    Raises ValueError for bad or unknown ids.
+    """
+    from provider_stats import rebuild_provider_stats
+
+    source_ids = sorted({int(s) for s in source_ids} - {int(target_id)})
+    if not source_ids:
+        raise ValueError("source_ids must name at least one provider other than the target")
+    found = set(session.execute(select(Provider.id).where(Provider.id.in_([target_id] + source_ids))).scalars())
+    missing = sorted(set([target_id] + source_ids) - found)
+    if missing:
+        raise ValueError(f"Unknown provider ids: {', '.join(map(str, missing))}")
+
+    params = {"target": target_id, "sources": source_ids}
+    def run(sql):
+        return session.execute(text(sql).bindparams(bindparam('sources', expanding=True)), params).rowcount
+
+    moved = {
+        "purchases": run("UPDATE purchases SET provider_id = :target WHERE provider_id IN :sources"),
+        "cost_history": run("UPDATE cost_history SET provider_id = :target WHERE provider_id IN :sources"),
+    }
+    run("UPDATE providers SET " + ', '.join(
+        f"{col} = COALESCE(NULLIF({col}, ''), (SELECT {col} FROM providers WHERE id IN :sources "
+        f"AND COALESCE({col}, '') != '' ORDER BY id LIMIT 1))"
+        for col in ('category', 'address', 'phone', 'email', 'notes')
+    ) + " WHERE id = :target")
+
+    # Rollup rows reference providers: drop the sources' with them, then rebuild the target
+    run("DELETE FROM provider_item_stats WHERE provider_id IN :sources")
+    run("DELETE FROM provider_stats WHERE provider_id IN :sources")
+    run("DELETE FROM providers WHERE id IN :sources")
+    rebuild_provider_stats(session, [target_id])
+    return dict(moved, target_id=target_id, merged=source_ids)
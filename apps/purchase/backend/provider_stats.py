@@ -0,0 +1,171 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import select, text, func, bindparam, DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import db
+from models import Purchase, ProviderStats, ProviderItemStats
+
+# Provider analytics rollup.
+# provider_stats holds total spend / purchase count / volatility / last purchase date,
+# provider_item_stats holds line counts per (provider, item name) for the top-N list.
+# Writers accumulate a StatsDelta and apply it inside their own transaction with
+# INSERT ... ON CONFLICT DO UPDATE SET x = x + delta (safe across workers).
+# rebuild_provider_stats() recomputes everything from the base tables (repair).
+
+TOP_ITEMS = 5
+
+class StatsDelta:
+    def __init__(self):
+        self.providers = {} # provider_id -> {spend, count, volatility, last_date}
+        self.items = Counter() # (provider_id, item_name) -> lines
+        self.removed_from = set() # providers whose last_purchase_date must be recomputed
+
+    def _provider(self, provider_id):
+        return self.providers.setdefault(provider_id, {"spend": 0.0, "count": 0, "volatility": 0, "last_date": None})
+
+    def add_purchase(self, provider_id, total_amount, date, item_names):
+        p = self._provider(provider_id)
+        p["spend"] += total_amount or 0.0
+        p["count"] += 1
+        if date and (p["last_date"] is None or date > p["last_date"]):
+            p["last_date"] = date
+        for name in item_names:
+            if name:
+                self.items[(provider_id, name)] += 1
+
+    def remove_purchase(self, provider_id, total_amount, item_names):
+        p = self._provider(provider_id)
+        p["spend"] -= total_amount or 0.0
+        p["count"] -= 1
+        for name in item_names:
+            if name:
+                self.items[(provider_id, name)] -= 1
+        self.removed_from.add(provider_id)
+
+    def add_cost_changes(self, provider_id, count):
+        if count:
+            self._provider(provider_id)["volatility"] += count
+
+    def apply(self, session=None):
+        session = session or db.session
+        now = datetime.utcnow()
+
+        if self.providers:
+            stmt = sqlite_insert(ProviderStats.__table__)
+            current = ProviderStats.__table__.c
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['provider_id'],
+                set_={
+                    "total_spend": current.total_spend + stmt.excluded.total_spend,
+                    "purchase_count": current.purchase_count + stmt.excluded.purchase_count,
+                    "volatility": current.volatility + stmt.excluded.volatility,
+                    "last_purchase_date": func.coalesce(
+                        func.max(current.last_purchase_date, stmt.excluded.last_purchase_date),
+                        current.last_purchase_date, stmt.excluded.last_purchase_date
+                    ),
+                    "updated_at": now,
+                }
+            )
+            session.execute(stmt, [
+                {"provider_id": pid, "total_spend": d["spend"], "purchase_count": d["count"],
+                 "volatility": d["volatility"], "last_purchase_date": d["last_date"], "updated_at": now}
+                for pid, d in self.providers.items()
+            ])
+
+        if self.items:
+            stmt = sqlite_insert(ProviderItemStats.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['provider_id', 'catalog_item_name'],
+                set_={"line_count": ProviderItemStats.__table__.c.line_count + stmt.excluded.line_count}
+            )
+            session.execute(stmt, [
+                {"provider_id": pid, "catalog_item_name": name, "line_count": n}
+                for (pid, name), n in self.items.items() if n
+            ])
+
+        if self.removed_from:
+            session.execute(text("DELETE FROM provider_item_stats WHERE line_count <= 0"))
+            session.flush()
+            for pid in self.removed_from:
+                # Indexed lookup on (provider_id, status, date)
+                last = session.execute(
+                    select(func.max(Purchase.date)).where(Purchase.provider_id == pid, Purchase.status == 'confirmed')
+                ).scalar()
+                session.execute(
+                    ProviderStats.__table__.update().where(ProviderStats.provider_id == pid).values(last_purchase_date=last)
+                )
+
+def record_removed(purchase):
+    # Only confirmed purchases are part of the rollup
+    if purchase.status != 'confirmed':
+        return
+    delta = StatsDelta()
+    delta.remove_purchase(purchase.provider_id, purchase.total_amount,
+                          [l.catalog_item_name for l in purchase.lines])
+    delta.apply()
+
+def provider_metrics(provider_id):
+    # O(1): primary-key read + index range scan for the top items
+    stats = db.session.get(ProviderStats, provider_id)
+    top = db.session.execute(
+        select(ProviderItemStats.catalog_item_name, ProviderItemStats.line_count).
+        where(ProviderItemStats.provider_id == provider_id).
+        order_by(ProviderItemStats.line_count.desc()).
+        limit(TOP_ITEMS)
+    ).all()
+
+    metrics = {
+        "total_spend": stats.total_spend if stats else 0.0,
+        "purchase_count": stats.purchase_count if stats else 0,
+        "volatility": stats.volatility if stats else 0,
+        "last_purchase_date": stats.last_purchase_date if stats else None
+    }
+    return metrics, [{"name": n, "count": c} for n, c in top]
+
+REBUILD_SQL = [
+    "DELETE FROM provider_item_stats{where}",
+    "DELETE FROM provider_stats{where}",
+    """INSERT INTO provider_stats (provider_id, total_spend, purchase_count, volatility, last_purchase_date, updated_at)
+       SELECT p.id, COALESCE(s.spend, 0), COALESCE(s.cnt, 0), COALESCE(v.cnt, 0), s.last_date, :now
+       FROM providers p
+       LEFT JOIN (SELECT provider_id, SUM(total_amount) AS spend, COUNT(*) AS cnt, MAX(date) AS last_date
+                  FROM purchases WHERE status = 'confirmed'{and_} GROUP BY provider_id) s ON s.provider_id = p.id
+       LEFT JOIN (SELECT provider_id, COUNT(*) AS cnt FROM cost_history{where} GROUP BY provider_id) v ON v.provider_id = p.id
+       {where_p}""",
+    """INSERT INTO provider_item_stats (provider_id, catalog_item_name, line_count)
+       SELECT pu.provider_id, pl.catalog_item_name, COUNT(*)
+       FROM purchase_lines pl JOIN purchases pu ON pu.id = pl.purchase_id
+       WHERE pu.status = 'confirmed' AND pl.catalog_item_name IS NOT NULL{and_pu}
+       GROUP BY pu.provider_id, pl.catalog_item_name""",
+]
+
+def rebuild_provider_stats(conn, provider_ids=None):
+    """
+    Recompute the rollup from the base tables (set-based). conn: Connection or Session.
+    provider_ids limits it to those providers (indexed on provider_id; merges).
+    """
+    now = datetime.utcnow()
+    if provider_ids is None:
+        parts = dict(where='', and_='', where_p='', and_pu='')
+        params = {}
+    else:
+        parts = dict(where=' WHERE provider_id IN :ids', and_=' AND provider_id IN :ids',
+                     where_p='WHERE p.id IN :ids', and_pu=' AND pu.provider_id IN :ids')
+        params = {"ids": list(provider_ids)}
+    for sql in REBUILD_SQL:
+        stmt = text(sql.format(**parts))
+        if ':now' in sql:
+            stmt = stmt.bindparams(bindparam('now', value=now, type_=DateTime()))
+        if params:
+            stmt = stmt.bindparams(bindparam('ids', expanding=True))
+        conn.execute(stmt, params)
+
+def clear_provider_stats(conn):
+    conn.execute(text("DELETE FROM provider_item_stats"))
+    conn.execute(text("DELETE FROM provider_stats"))
+
+if __name__ == "__main__":
+    # Same as: python manage.py rebuild-stats
+    import sys
+    from manage import main
+    sys.exit(main(['rebuild-stats']))
@@ -0,0 +1,161 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import select, insert
+from database import db, insert_returning_ids
+from models import Provider, CatalogItem, Purchase, PurchaseLine
+from extensions import catalog
+
+# Draft creation engine (POST /api/purchases and POST /api/purchases/batch).
+#
+# - Every payload is validated up front with one IN query for providers and the
+#   catalog read model (catalog_cache.py) for items; invalid payloads get an error
+#   result, valid ones are created.
+# - Purchases, pending (ad-hoc) catalog items and lines go out as three executemany
+#   INSERT ... RETURNING statements, whatever the number of purchases.
+# - Temporary SKU / loyverse_id come from uuid4: no collisions when several new
+#   items arrive in the same second.
+
+IN_CHUNK = 900
+
+def _chunks(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), IN_CHUNK):
+        yield ids[i:i + IN_CHUNK]
+
+def _existing(column, ids, value=None):
+    # {id: value} (or {id: None}) for the ids that exist, one query per 900 ids
+    found = {}
+    for chunk in _chunks(ids):
+        stmt = select(column, value if value is not None else column).where(column.in_(chunk))
+        found.update(db.session.execute(stmt).all())
+    return found
+
+def _as_int(value):
+    # Forms send ids as strings ("12")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _normalized(payload):
+    if not isinstance(payload, dict):
+        return payload
+    payload = dict(payload, provider_id=_as_int(payload.get('provider_id')))
+    payload['items'] = [
+        item if item.get('is_new_item') else dict(item, catalog_item_id=_as_int(item.get('catalog_item_id')))
+        for item in (payload.get('items') or []) if isinstance(item, dict)
+    ]
+    return payload
+
+def temp_ids():
+    # (sku, loyverse_id) for a pending item
+    token = uuid.uuid4().hex
+    return f"TEMP-{token[:12].upper()}", f"temp-{token}"
+
+def _validate(payload, providers, items):
+    if not isinstance(payload, dict):
+        return "purchase must be an object"
+    if payload.get('provider_id') not in providers:
+        return f"Unknown provider_id {payload.get('provider_id')}"
+    if 'date' in payload:
+        try:
+            datetime.fromisoformat(payload['date'])
+        except (TypeError, ValueError):
+            return f"Invalid date {payload['date']!r}"
+    for n, item in enumerate(payload.get('items', [])):
+        missing = [k for k in ('quantity', 'unit_cost', 'total_cost') if k not in item]
+        if missing:
+            return f"items[{n}]: missing {', '.join(missing)}"
+        if not item.get('is_new_item') and item.get('catalog_item_id') not in items:
+            return f"items[{n}]: unknown catalog_item_id {item.get('catalog_item_id')}"
+    return None
+
+def create_purchases(payloads):
+    """
+    Create draft purchases in the caller's transaction.
+    Returns (results, created_ids): one result per payload, in order, with the
+    client's 'client_ref' echoed back when given.
+    """
+    payloads = [_normalized(p) for p in payloads]
+    provider_ids = {p.get('provider_id') for p in payloads if isinstance(p, dict)}
+    item_ids = {i.get('catalog_item_id') for p in payloads if isinstance(p, dict)
+                for i in p.get('items', []) if not i.get('is_new_item')}
+    providers = _existing(Provider.id, provider_ids - {None})
+    items = {iid: entry.name for iid, entry in catalog.get_many(item_ids - {None}).items()}
+
+    results = []
+    valid = []
+    for index, payload in enumerate(payloads):
+        result = {"index": index}
+        if isinstance(payload, dict) and 'client_ref' in payload:
+            result["client_ref"] = payload['client_ref']
+        error = _validate(payload, providers, items)
+        if error:
+            result.update({"status": "error", "error": error})
+        else:
+            valid.append((result, payload))
+        results.append(result)
+
+    if not valid:
+        return results, []
+
+    # 1. Headers
+    now = datetime.utcnow()
+    headers = []
+    for _, payload in valid:
+        items_data = payload.get('items', [])
+        headers.append({
+            "provider_id": payload['provider_id'],
+            "total_amount": payload.get('total_amount', sum(i.get('total_cost', 0) for i in items_data)),
+            "status": 'draft',
+            "date": datetime.fromisoformat(payload['date']) if 'date' in payload else now,
+            "invoice_number": payload.get('invoice_number'),
+            "notes": payload.get('notes')
+        })
+    purchase_ids = insert_returning_ids(db.session, Purchase.__table__, headers)
+
+    # 2. Pending catalog items for ad-hoc lines
+    new_items = []
+    for _, payload in valid:
+        for item in payload.get('items', []):
+            if item.get('is_new_item'):
+                sku, loyverse_id = temp_ids()
+                new_items.append({
+                    "name": item.get('catalog_item_name', 'Unknown'),
+                    "category_id": item.get('category', 'General'),
+                    "current_cost": item.get('unit_cost', 0),
+                    "default_unit": item.get('unit_label', 'und'),
+                    "is_by_weight": item.get('unit_label') == 'kg',
+                    "sku": item.get('sku') or sku,
+                    "loyverse_id": loyverse_id,
+                    "is_pending": True,
+                    "updated_at": now
+                })
+    new_item_ids = iter([])
+    if new_items:
+        new_item_ids = iter(insert_returning_ids(db.session, CatalogItem.__table__, new_items))
+
+    # 3. Lines
+    lines = []
+    for (result, payload), purchase_id in zip(valid, purchase_ids):
+        for item in payload.get('items', []):
+            if item.get('is_new_item'):
+                catalog_id, name = next(new_item_ids), item.get('catalog_item_name', 'Unknown')
+            else:
+                catalog_id = item['catalog_item_id']
+                name = item.get('catalog_item_name') or items[catalog_id] # forms may omit the name
+            lines.append({
+                "purchase_id": purchase_id,
+                "catalog_item_id": catalog_id,
+                "catalog_item_name": name,
+                "quantity": item['quantity'],
+                "unit_cost": item['unit_cost'],
+                "total_cost": item['total_cost'],
+                "is_new_item": bool(item.get('is_new_item', False)),
+                "temp_category": item.get('category')
+            })
+        result.update({"status": "created", "id": purchase_id})
+    if lines:
+        db.session.execute(insert(PurchaseLine.__table__), lines)
+
+    return results, purchase_ids
@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, text, bindparam, DateTime
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import PurgeJob
+
+# Purge and retention engine (POST /api/settings/purge-data, manage.py purge).
+#
+# - Modes: 'transactions_only' (all purchases, lines, cost history and the rollups),
+#   'full_wipe' (that plus catalog and providers) and 'retention' (confirmed purchases
+#   dated before a cutoff; provider_stats / provider_item_stats and cost_history are
+#   kept, cost rows only lose the link to their deleted line).
+# - Deletes run in batches, each in its own short transaction: a batch of purchases
+#   goes with its lines and cost rows, so readers never see a half-deleted purchase.
+#   Between batches the write lock is released (PAUSE) and other requests get in.
+# - The job row in purge_jobs is updated inside every batch transaction (progress and
+#   heartbeat), so any worker can report it. A unique partial index allows one running
+#   job; a job whose heartbeat is older than STALE_AFTER (worker died) is failed.
+# - Afterwards PRAGMA incremental_vacuum returns the freed pages to the OS in steps
+#   (needs auto_vacuum=INCREMENTAL, migration v7).
+# - Triggers keep working: search index rows and change_log tombstones are written as
+#   the rows go. When the job ends the price series is dropped and rebuilt on the next
+#   read, so purged prices leave the trend API and the anomaly history.
+
+log = logging.getLogger(__name__)
+
+MODES = ('transactions_only', 'full_wipe', 'retention')
+PURCHASE_BATCH = 200 # purchases (with their lines) per transaction
+ROW_BATCH = 2000 # rows per transaction for flat tables
+VACUUM_PAGES = 2000 # pages freed per incremental_vacuum step
+PAUSE = 0.01 # seconds between batches
+STALE_AFTER = timedelta(minutes=5)
+
+_jobs = PurgeJob.__table__
+
+def months_ago(months, now=None):
+    now = now or datetime.utcnow()
+    month = now.month - 1 - months
+    year, month = now.year + month // 12, month % 12 + 1
+    days = [31, 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    return now.replace(year=year, month=month, day=min(now.day, days[month - 1]))
+
+def start_purge(engine, mode, older_than_months=None, background=True):
+    """
+    Create the job and run it (in a thread unless background=False). Returns the job id.
+    Raises ValueError for bad arguments and RuntimeError if a purge is already running.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown purge mode '{mode}'. Options: {', '.join(MODES)}")
+    cutoff = None
+    if mode == 'retention':
+        if older_than_months is None or int(older_than_months) < 1:
+            raise ValueError("retention needs older_than_months >= 1")
+        cutoff = months_ago(int(older_than_months))
+
+    now = datetime.utcnow()
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                _jobs.update().where(_jobs.c.status == 'running', _jobs.c.updated_at < now - STALE_AFTER).
+                values(status='failed', error='Worker stopped responding', finished_at=now)
+            )
+            job_id = conn.execute(_jobs.insert().values(
+                mode=mode, cutoff=cutoff, status='running', phase='queued', progress='{}', created_at=now, updated_at=now
+            )).inserted_primary_key[0]
+    except IntegrityError:
+        raise RuntimeError("A purge is already running")
+
+    if background:
+        threading.Thread(target=run_job, args=(engine, job_id), name=f'purge-{job_id}', daemon=True).start()
+    else:
+        run_job(engine, job_id)
+    return job_id
+
+def get_job(job_id):
+    job = db.session.get(PurgeJob, job_id)
+    return job.to_dict() if job else None
+
+class _Job:
+    def __init__(self, engine, job_id, cutoff):
+        self.engine = engine
+        self.id = job_id
+        self.cutoff = cutoff
+        self.deleted = {}
+
+    def batch(self, phase, work):
+        """work(conn) -> {table: rows}, committed together with the job progress. Returns the row total."""
+        with self.engine.begin() as conn:
+            counts = work(conn)
+            deleted = dict(self.deleted)
+            for table, n in counts.items():
+                deleted[table] = deleted.get(table, 0) + n
+            conn.execute(
+                _jobs.update().where(_jobs.c.id == self.id).
+                values(phase=phase, progress=json.dumps(deleted), updated_at=datetime.utcnow())
+            )
+        self.deleted = deleted
+        from extensions import cache
+        cache.invalidate('purchases', 'catalog', 'providers')
+        time.sleep(PAUSE)
+        return sum(counts.values())
+
+    def purchases(self, where, keep_cost_history):
+        pick = text(f"SELECT id FROM purchases WHERE {where} LIMIT {PURCHASE_BATCH}")
+        lines = "SELECT id FROM purchase_lines WHERE purchase_id IN :ids"
+        cost = (f"UPDATE cost_history SET purchase_line_id = NULL WHERE purchase_line_id IN ({lines})" if keep_cost_history
+                else f"DELETE FROM cost_history WHERE purchase_line_id IN ({lines})")
+
+        def work(conn):
+            ids = conn.execute(pick.bindparams(bindparam('cutoff', value=self.cutoff, type_=DateTime()))
+                               if ':cutoff' in where else pick).scalars().all()
+            if not ids:
+                return {}
+            counts = {}
+            for table, sql in (('cost_history', cost),
+                               ('purchase_lines', "DELETE FROM purchase_lines WHERE purchase_id IN :ids"),
+                               ('purchases', "DELETE FROM purchases WHERE id IN :ids")):
+                rowcount = conn.execute(text(sql).bindparams(bindparam('ids', expanding=True)), {"ids": ids}).rowcount
+                if table != 'cost_history' or not keep_cost_history:
+                    counts[table] = rowcount
+            return counts
+        while self.batch('purchases', work):
+            pass
+
+    def rows(self, table):
+        def work(conn):
+            return {table: conn.execute(text(
+                f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} LIMIT {ROW_BATCH})"
+            )).rowcount}
+        while self.batch(table, work):
+            pass
+
+    def rollups(self):
+        # Small tables (one row per provider / provider-item): one statement each
+        self.batch('rollups', lambda conn: {
+            table: conn.execute(text(f"DELETE FROM {table}")).rowcount for table in ('provider_item_stats', 'provider_stats')
+        })
+
+    def vacuum(self):
+        with self.engine.connect() as conn:
+            if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                return # pre-v7 file: pages stay in the freelist and get reused
+        while True:
+            raw = self.engine.raw_connection()
+            try:
+                dbapi = raw.driver_connection
+                free = dbapi.execute("PRAGMA freelist_count").fetchone()[0]
+                if free:
+                    # executescript steps the pragma to the end; execute() frees one page per call
+                    dbapi.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+            finally:
+                raw.close()
+            if not free:
+                return
+            self.batch('vacuum', lambda conn: {'pages_freed': min(free, VACUUM_PAGES)})
+
+def run_job(engine, job_id):
+    with engine.connect() as conn:
+        mode, cutoff = conn.execute(select(_jobs.c.mode, _jobs.c.cutoff).where(_jobs.c.id == job_id)).one()
+    job = _Job(engine, job_id, cutoff)
+    try:
+        if mode == 'retention':
+            job.purchases("status = 'confirmed' AND date < :cutoff", keep_cost_history=True)
+        else:
+            job.purchases("1 = 1", keep_cost_history=False)
+            job.rows('cost_history')
+            job.rollups()
+            if mode == 'full_wipe':
+                job.rows('catalog_items')
+                job.rows('providers')
+        job.vacuum()
+        status, error = 'done', None
+    except Exception as e:
+        log.exception("Purge job %s failed", job_id)
+        status, error = 'failed', str(e)
+    # Purged points must leave the trend API and the anomaly history now (price_series.py)
+    from price_series import invalidate_series
+    invalidate_series()
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(
+            _jobs.update().where(_jobs.c.id == job_id).
+            values(status=status, phase=None, error=error, progress=json.dumps(job.deleted), updated_at=now, finished_at=now)
+        )
+    log.info("Purge job %s (%s) %s: %s", job_id, mode, status, job.deleted)
+    return status
@@ -0,0 +1,741 @@
+from flask import Blueprint, current_app, jsonify, request, render_template, send_file, abort
+from sqlalchemy import select, delete, exists
+import os
+from datetime import datetime
+from database import db
+from models import Provider, CatalogItem, Purchase, PurchaseLine
+from extensions import cache, audit, instrumentation, catalog
+from idempotency import idempotent, record
+from pagination import Keyset
+
+# Screens and JSON API, registered on the app by create_app() (app.py).
+# Heavy modules (pandas, numpy, csv helpers, analytics) are imported inside the
+# handlers that use them, so building the app stays cheap.
+
+bp = Blueprint('purchase', __name__)
+
+# Sort keys of the paginated lists (pagination.py); purchases: serializers.PURCHASES_NEWEST_FIRST
+PROVIDERS_BY_NAME = Keyset(Provider.name, Provider.id)
+CATALOG_BY_UPDATE = Keyset(CatalogItem.updated_at, CatalogItem.id, descending=True, nullable_first=True)
+
+@bp.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({"status": "ok", "message": "Enigma Purchase App Backend Running"}), 200
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format, this worker only
+    return instrumentation.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# --- FRONTEND ROUTES ---
+@bp.route('/')
+def index():
+    # Inbox Logic: Count Drafts
+    draft_count = Purchase.query.filter_by(status='draft').count()
+    return render_template('hub.html', draft_count=draft_count)
+
+@bp.route('/settings')
+def settings():
+    return render_template('settings.html')
+
+
+
+@bp.route('/drafts')
+def drafts_list():
+    # Newest first, one page at a time (keyset, see pagination.py)
+    from serializers import purchase_dicts, purchases_query, PURCHASES_NEWEST_FIRST, purchase_key
+    from pagination import parse_page_args, next_url
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    rows = purchase_dicts(PURCHASES_NEWEST_FIRST.apply(purchases_query(Purchase.status == 'draft'), after, limit + 1))
+    drafts, cursor = PURCHASES_NEWEST_FIRST.page(rows, limit, purchase_key)
+    return render_template('drafts.html', drafts=drafts, next_page=next_url(cursor))
+
+@bp.route('/providers/<int:provider_id>')
+def provider_detail(provider_id):
+    p = Provider.query.get_or_404(provider_id)
+    
+    # Metrics + top items come from the provider_stats rollup (O(1), see provider_stats.py)
+    from provider_stats import provider_metrics
+    metrics, top_items = provider_metrics(provider_id)
+    
+    # History List (Recent 20)
+    history = Purchase.query.filter_by(provider_id=provider_id, status='confirmed').order_by(Purchase.date.desc()).limit(20).all()
+
+    return render_template('provider_detail.html', provider=p, metrics=metrics, top_items=top_items, history=history)
+
+@bp.route('/comparison')
+def comparison():
+    return render_template('product_comparison.html')
+
+@bp.route('/new-purchase')
+def new_purchase():
+    # Screen 1: Register Purchase
+    return render_template('register_purchase.html')
+
+@bp.route('/add-product')
+def add_product():
+    # Screen 2: Add Product
+    provider_id = request.args.get('provider_id')
+    provider_name = request.args.get('provider_name')
+    return render_template('add_product.html', provider_id=provider_id, provider_name=provider_name)
+
+@bp.route('/purchase-detail')
+def purchase_detail():
+    item_id = request.args.get('item_id')
+    item_name = request.args.get('item_name')
+    last_cost = request.args.get('last_cost')
+    provider_id = request.args.get('provider_id')
+    unit_label = request.args.get('unit_label', 'Und') # Passed from Add Product
+    return render_template('purchase_detail.html', 
+                          item_id=item_id, item_name=item_name, 
+                          last_cost=last_cost, provider_id=provider_id,
+                          unit_label=unit_label)
+
+
+
+@bp.route('/list-providers')
+def list_providers_view():
+    from pagination import parse_page_args, next_url
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    providers, cursor = PROVIDERS_BY_NAME.fetch(select(Provider), after, limit, key=lambda p: (p.name, p.id))
+    return render_template('providers_list.html', providers=[p.to_dict() for p in providers], next_page=next_url(cursor))
+
+@bp.route('/price-monitor')
+def price_monitor():
+    return render_template('price_monitor.html')
+
+@bp.route('/review/<int:purchase_id>')
+def review_purchase(purchase_id):
+    from serializers import PURCHASE_LOAD_OPTIONS
+    purchase = Purchase.query.options(*PURCHASE_LOAD_OPTIONS).filter_by(id=purchase_id).first_or_404()
+    
+    # Enrichment: price impact + anomaly severity per line (anomaly.py)
+    from anomaly import score_lines
+    scores = score_lines(purchase, current_app.config['PRICE_SERIES_DIR'])
+    enriched_lines = [dict(score, line=line) for line, score in zip(purchase.lines, scores)]
+    has_alerts = any(s['status'] == 'up' or s['severity'] in ('warning', 'critical') for s in scores)
+
+    return render_template('confirmation.html', purchase=purchase, lines=enriched_lines, has_alerts=has_alerts) 
+
+@bp.route('/api/purchases/<int:purchase_id>/anomalies', methods=['GET'])
+def get_purchase_anomalies(purchase_id):
+    from anomaly import score_lines
+    from serializers import PURCHASE_LOAD_OPTIONS
+    purchase = Purchase.query.options(*PURCHASE_LOAD_OPTIONS).filter_by(id=purchase_id).first_or_404()
+    return jsonify({"purchase_id": purchase.id, "lines": score_lines(purchase, current_app.config['PRICE_SERIES_DIR'])})
+
+@bp.route('/confirmation')
+def confirmation():
+    return "Deprecated", 410
+
+# --- API ENDPOINTS ---
+
+@bp.route('/api/providers/<int:provider_id>/history', methods=['GET'])
+def get_provider_history(provider_id):
+    # Purchases for this provider (headers + lines: 2 queries, see serializers.py), ?cursor= pages further
+    from serializers import purchase_dicts, purchases_query, PURCHASES_NEWEST_FIRST, purchase_key
+    from pagination import parse_page_args, next_url
+    try:
+        after, limit = parse_page_args(request.args, default=50, maximum=200)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = purchase_dicts(PURCHASES_NEWEST_FIRST.apply(purchases_query(Purchase.provider_id == provider_id), after, limit + 1))
+    purchases, cursor = PURCHASES_NEWEST_FIRST.page(rows, limit, purchase_key)
+    # Summary stats (this page)
+    total_spent = sum(p['total_amount'] for p in purchases)
+    
+    return jsonify({
+        "total_spent": total_spent,
+        "purchases": purchases,
+        "next_cursor": cursor,
+        "next": next_url(cursor)
+    })
+
+@bp.route('/api/catalog/monitor', methods=['GET'])
+@cache.cached(tags=('catalog',))
+def get_price_monitor():
+    # Items with cost > 0, ordered by last update (pages: Link rel="next")
+    from pagination import parse_page_args, paginated_json
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    items, cursor = CATALOG_BY_UPDATE.fetch(
+        select(CatalogItem).where(CatalogItem.current_cost > 0), after, limit, key=lambda i: (i.updated_at, i.id)
+    )
+    return paginated_json([i.to_dict() for i in items], cursor)
+
+
+@bp.route('/api/sync/changes', methods=['GET'])
+def get_sync_changes():
+    # Delta feed for offline clients: ?since=<cursor>&entities=catalog,providers,purchases&limit=500
+    from sync_feed import changes_since, DEFAULT_LIMIT
+    try:
+        entities = [e for e in request.args.get('entities', '').split(',') if e] or None
+        return jsonify(changes_since(request.args.get('since'), entities, request.args.get('limit', DEFAULT_LIMIT)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/purchases/recent', methods=['GET'])
+def get_recent_purchases():
+    # Only return last 5 purchases (same shape as Purchase.to_dict, built from row tuples)
+    from serializers import purchase_dicts, purchases_query
+    purchases = purchase_dicts(purchases_query().order_by(Purchase.date.desc()).limit(5))
+    return jsonify(purchases)
+
+@bp.route('/api/export/purchases')
+def export_purchases():
+    # Streamed: one joined query read in chunks (provider, SKU and unit come from real data)
+    from flask import Response, stream_with_context
+    from exports import stream_csv, purchase_rows, PURCHASES_HEADER
+    
+    output = Response(stream_with_context(stream_csv(PURCHASES_HEADER, purchase_rows())), mimetype='text/csv')
+    output.headers["Content-Disposition"] = "attachment; filename=historial_compras.csv"
+    return output
+
+@bp.route('/api/settings/upload-catalog', methods=['POST'])
+def upload_catalog():
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+        
+    if file:
+        # Save temp
+        filepath = os.path.join(os.path.dirname(__file__), '..', 'data', 'temp_upload.csv')
+        file.save(filepath)
+        
+        # Bulk ingest: preloaded diff + chunked upserts in one transaction
+        try:
+            from seed_db import ingest_catalog
+            report = ingest_catalog(filepath)
+            cache.invalidate('catalog', 'providers')
+            report.update({"items_added": report['inserted']})
+            return jsonify(report)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/export/catalog-items')
+def export_catalog_items():
+    from flask import Response, stream_with_context
+    from exports import stream_csv, catalog_rows, CATALOG_HEADER
+    
+    output = Response(stream_with_context(stream_csv(CATALOG_HEADER, catalog_rows())), mimetype='text/csv')
+    output.headers["Content-Disposition"] = "attachment; filename=export_catalog_FULL.csv"
+    return output
+
+@bp.route('/api/analysis/comparison/<int:item_id>')
+def analyze_item_prices(item_id):
+    # Logic: Latest price for each provider that sold this item (single windowed query)
+    from analytics import latest_prices_by_item
+    providers = latest_prices_by_item([item_id]).get(item_id, [])
+    
+    return jsonify({
+        "item_id": item_id,
+        "providers": providers
+    })
+
+@bp.route('/api/analysis/trend/<int:item_id>')
+@cache.cached(tags=('purchases',), ttl=60)
+def analyze_item_trend(item_id):
+    # Unit-cost series per provider: ?days=365|all or ?from=&to=, ?rolling=30 (days)
+    from price_series import parse_trend_args, item_trend
+    try:
+        start, end, rolling_days = parse_trend_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(item_trend(current_app.config['PRICE_SERIES_DIR'], item_id, start, end, rolling_days))
+
+@bp.route('/api/analysis/comparison', methods=['GET', 'POST'])
+def analyze_prices_batch():
+    # Batch version for the price monitor: many items (or "all") in one round trip.
+    # GET ?ids=1,2,3 | ?ids=all   POST {"item_ids": [1,2,3] | "all"}
+    from analytics import latest_prices_by_item
+    
+    if request.method == 'POST':
+        raw_ids = (request.json or {}).get('item_ids', 'all')
+    else:
+        raw_ids = request.args.get('ids', 'all')
+        if raw_ids != 'all':
+            raw_ids = [x for x in raw_ids.split(',') if x.strip()]
+    
+    if raw_ids == 'all':
+        item_ids = None
+    else:
+        try:
+            item_ids = [int(x) for x in raw_ids]
+        except (TypeError, ValueError):
+            return jsonify({"error": "item_ids must be a list of integers or 'all'"}), 400
+    
+    prices = latest_prices_by_item(item_ids)
+    
+    return jsonify({
+        "items": {str(iid): providers for iid, providers in prices.items()}
+    })
+
+
+
+@bp.route('/api/analysis/top-providers')
+@cache.cached(tags=('purchases', 'providers'))
+def get_top_providers():
+    # Providers ranked by confirmed purchases (?window=30|90|365|all, ?rank=count|spend)
+    from analytics import parse_ranking_args, top_providers
+    try:
+        window_days, rank_by = parse_ranking_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = []
+    for p, purchase_count, spend in top_providers(window_days, rank_by):
+        row = p.to_dict()
+        row.update({"purchase_count": purchase_count, "total_spend": spend})
+        results.append(row)
+            
+    return jsonify(results)
+
+@bp.route('/api/analysis/provider/<int:provider_id>/top-items')
+@cache.cached(tags=('purchases', 'catalog'))
+def get_provider_top_items(provider_id):
+    # Items most frequently bought from this provider (confirmed purchases, same args as above)
+    from analytics import parse_ranking_args, provider_top_items
+    try:
+        window_days, rank_by = parse_ranking_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = []
+    for iid, name, sku, current_cost, line_count, spend in provider_top_items(provider_id, window_days, rank_by):
+        results.append({
+            "id": iid,
+            "name": name,
+            "sku": sku,
+            "last_cost": current_cost, # Useful for display
+            "line_count": line_count,
+            "total_spend": spend
+        })
+            
+    return jsonify(results)
+
+@bp.route('/api/purchases', methods=['POST'])
+@idempotent('purchases.create')
+def create_purchase():
+    # Create as DRAFT (pending catalog items for ad-hoc lines), see purchase_batch.py
+    from purchase_batch import create_purchases
+    from serializers import purchases_query, purchase_dicts
+    data = request.json
+    try:
+        results, created = create_purchases([data])
+        if not created:
+            return jsonify({"error": results[0]['error']}), 400
+
+        body = purchase_dicts(purchases_query(Purchase.id == created[0]))[0]
+        record(body, 201)
+        db.session.commit()
+        cache.invalidate('catalog') # may have added pending items (drafts are not ranked)
+        return jsonify(body), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/purchases/batch', methods=['POST'])
+@idempotent('purchases.batch')
+def create_purchase_batch():
+    # Offline sync: many drafts in one call, one result per purchase (failures don't block the rest)
+    from purchase_batch import create_purchases
+    purchases = (request.json or {}).get('purchases')
+    if not isinstance(purchases, list) or not purchases:
+        return jsonify({"error": "purchases must be a non-empty list"}), 400
+
+    try:
+        results, created = create_purchases(purchases)
+        body = {
+            "results": results,
+            "created": len(created),
+            "failed": len(results) - len(created)
+        }
+        record(body, 200)
+        db.session.commit()
+        if created:
+            cache.invalidate('catalog')
+        return jsonify(body), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/purchases/<int:purchase_id>/confirm', methods=['POST'])
+def confirm_purchase(purchase_id):
+    from confirmation import load_purchases, confirm_purchases, history_log_rows
+    try:
+        purchases, missing = load_purchases([purchase_id])
+        if missing:
+            return jsonify({"error": "Purchase not found"}), 404
+        purchase = purchases[0]
+        
+        if purchase.status == 'confirmed':
+            return jsonify({"error": "Already confirmed"}), 400
+
+        # Update status + costs, promote pending items, history + provider rollup
+        confirm_purchases(purchases)
+        result = purchase.to_dict()
+        entries = audit.stage(db.session, history_log_rows(purchases))
+        db.session.commit()
+        cache.invalidate('purchases', 'catalog')
+        
+        audit.publish(entries)
+            
+        return jsonify(result), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/purchases/confirm-batch', methods=['POST'])
+def confirm_purchase_batch():
+    # Week-end reconciliation: confirm many drafts atomically (all or nothing)
+    from confirmation import load_purchases, confirm_purchases, history_log_rows
+    data = request.json or {}
+    purchase_ids = data.get('purchase_ids') or []
+    if not purchase_ids:
+        return jsonify({"error": "purchase_ids required"}), 400
+
+    try:
+        purchases, missing = load_purchases(int(pid) for pid in purchase_ids)
+        if missing:
+            return jsonify({"error": "Purchase not found", "missing": missing}), 404
+        
+        already = [p.id for p in purchases if p.status == 'confirmed']
+        if already:
+            return jsonify({"error": "Already confirmed", "confirmed": already}), 400
+
+        report = confirm_purchases(purchases)
+        entries = audit.stage(db.session, history_log_rows(purchases))
+        db.session.commit()
+        cache.invalidate('purchases', 'catalog')
+
+        audit.publish(entries)
+
+        return jsonify(report), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/purchases/<int:purchase_id>', methods=['DELETE'])
+def delete_purchase(purchase_id):
+    try:
+        purchase = Purchase.query.get_or_404(purchase_id)
+        if purchase.status == 'confirmed':
+             return jsonify({"error": "Cannot delete confirmed purchase"}), 400
+             
+        # Pending catalog items created for this draft go with it, unless another draft
+        # (a clone) still has lines on them (read model lookup, catalog_cache.py)
+        items = catalog.get_many({line.catalog_item_id for line in purchase.lines})
+        pending_ids = [iid for iid, item in items.items() if item.is_pending]
+
+        # Keep the provider rollup in sync (no-op for drafts)
+        from provider_stats import record_removed
+        record_removed(purchase)
+
+        # Purchase + lines (cascade) must be gone before their items:
+        # foreign_keys=ON and no ORM relationship line -> item to order the flush
+        db.session.delete(purchase)
+        db.session.flush()
+        if pending_ids:
+            db.session.execute(delete(CatalogItem).where(
+                CatalogItem.id.in_(pending_ids), CatalogItem.is_pending == True,
+                ~exists().where(PurchaseLine.catalog_item_id == CatalogItem.id)
+            ))
+        db.session.commit()
+        cache.invalidate('catalog') # pending items of the draft
+        return jsonify({"message": "Deleted"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/purchases/<int:purchase_id>/clone', methods=['POST'])
+def clone_purchase(purchase_id):
+    try:
+        original = Purchase.query.get_or_404(purchase_id)
+        
+        # Create new Draft
+        clone = Purchase(
+            provider_id=original.provider_id,
+            total_amount=original.total_amount,
+            status='draft'
+        )
+        db.session.add(clone)
+        db.session.flush()
+        
+        for line in original.lines:
+            new_line = PurchaseLine(
+                purchase_id=clone.id,
+                catalog_item_id=line.catalog_item_id,
+                catalog_item_name=line.catalog_item_name,
+                quantity=line.quantity,
+                unit_cost=line.unit_cost,
+                total_cost=line.total_cost
+            )
+            db.session.add(new_line)
+            
+        db.session.commit()
+        return jsonify(clone.to_dict()), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/providers', methods=['GET'])
+@cache.cached(tags=('providers',))
+def get_providers():
+    from pagination import parse_page_args, paginated_json
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    providers, cursor = PROVIDERS_BY_NAME.fetch(select(Provider), after, limit, key=lambda p: (p.name, p.id))
+    return paginated_json([p.to_dict() for p in providers], cursor)
+
+@bp.route('/api/providers', methods=['POST'])
+def create_provider():
+    data = request.json
+    if not data or 'name' not in data:
+        return jsonify({"error": "Name is required"}), 400
+    
+    from provider_dedup import normalize_provider, find_similar
+    raw_name = data['name'].strip()
+    normalized = normalize_provider(raw_name)
+    
+    # Check duplicate by normalized name (accents, punctuation and legal suffixes ignored)
+    existing = Provider.query.filter_by(normalized_name=normalized).first()
+    if existing:
+        return jsonify(existing.to_dict()), 200 # Return existing instead of creating duplicate
+    
+    new_provider = Provider(
+        name=raw_name.title(), 
+        category=data.get('category', 'General'),
+        normalized_name=normalized
+    )
+    db.session.add(new_provider)
+    db.session.flush()
+    # Near duplicates are reported, not merged: "Panaderia Luna" / "Panaderia Lina" may be two shops
+    similar = find_similar(raw_name, exclude={new_provider.id})
+    db.session.commit()
+    cache.invalidate('providers')
+    result = new_provider.to_dict()
+    result['possible_duplicates'] = [dict(p.to_dict(), score=score) for p, score in similar]
+    return jsonify(result), 201
+
+@bp.route('/api/providers/duplicates', methods=['GET'])
+def provider_duplicates():
+    from provider_dedup import duplicate_groups
+    try:
+        return jsonify({"groups": duplicate_groups()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/providers/merge', methods=['POST'])
+def merge_providers():
+    # Body: {"target_id": 3, "source_ids": [7, 9]} -> sources folded into the target
+    data = request.json or {}
+    if not data.get('target_id') or not data.get('source_ids'):
+        return jsonify({"error": "target_id and source_ids are required"}), 400
+    from provider_dedup import merge_providers as merge
+    try:
+        result = merge(db.session, int(data.get('target_id')), data.get('source_ids') or [])
+        db.session.commit()
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    # Series points and anomaly history carry provider ids: rebuild with the merged history
+    from price_series import invalidate_series
+    invalidate_series()
+    cache.invalidate('providers', 'purchases')
+    return jsonify(result), 200
+
+@bp.route('/api/providers/<int:provider_id>', methods=['PUT'])
+def update_provider(provider_id):
+    p = Provider.query.get_or_404(provider_id)
+    data = request.json
+    current_app.logger.debug("Update provider %s: %s", provider_id, data)
+    
+    if 'address' in data: p.address = data['address']
+    if 'phone' in data: p.phone = data['phone']
+    if 'email' in data: p.email = data['email']
+    if 'category' in data: p.category = data['category']
+    if 'notes' in data: p.notes = data['notes']
+    
+    try:
+        db.session.commit()
+        cache.invalidate('providers')
+        return jsonify(p.to_dict())
+    except Exception as e:
+        current_app.logger.error("Update provider %s failed: %s", provider_id, e)
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/catalog/search', methods=['GET'])
+def search_catalog():
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify([])
+    
+    # Ranked prefix search on the FTS index (accent-insensitive)
+    # EXCLUDE PENDING ITEMS (They are invisible until confirmed)
+    from catalog_search import search_items
+    items = search_items(query, limit=30)
+    
+    return jsonify([i.to_dict() for i in items])
+
+@bp.route('/optimizer')
+def optimizer_view():
+    return render_template('smart_shopping.html')
+
+@bp.route('/api/optimizer/analyze', methods=['POST'])
+def analyze_shopping_list():
+    data = request.json or {}
+    
+    # Logic: latest price matrix (items x providers) in one query, solved in bulk.
+    # Optional constraints: quantities, min_order, max_stops, staleness_weight
+    from optimizer import optimize
+    
+    try:
+        item_ids = [int(i) for i in data.get('item_ids', [])]
+        quantities = {int(k): float(v) for k, v in (data.get('quantities') or {}).items()}
+        max_stops = data.get('max_stops')
+        plan, warnings = optimize(
+            item_ids,
+            quantities=quantities,
+            min_order=data.get('min_order'),
+            max_stops=int(max_stops) if max_stops is not None else None,
+            staleness_weight=float(data.get('staleness_weight', 0) or 0)
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid optimizer input: {e}"}), 400
+    
+    response = jsonify(plan)
+    if warnings:
+        # Plan is still returned; it just could not satisfy every constraint
+        response.headers['X-Optimizer-Warnings'] = ','.join(warnings)
+    return response
+
+@bp.route('/api/settings/download-db')
+def download_db():
+    # Consistent online snapshot, gzip-streamed (backup.py); writers keep going
+    try:
+        from flask import Response
+        from backup import stream_gzip
+        chunks = stream_gzip(db.engine, current_app.config['BACKUP_DIR'])
+        name = f"backup_purchase_app_{datetime.now():%Y%m%d-%H%M%S}.db.gz"
+        return Response(chunks, mimetype='application/gzip', headers={'Content-Disposition': f'attachment; filename={name}'})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/settings/upload-db', methods=['POST'])
+def upload_db():
+    if 'file' not in request.files:
+        return jsonify({"error": "No file"}), 400
+    file = request.files['file']
+
+    try:
+        # Validated into a temp file, then swapped in atomically (backup.py)
+        from backup import restore, RestoreError
+        from database import prepare_schema
+        db.session.remove()
+        try:
+            saved = restore(db.engine, file.stream, current_app.config['BACKUP_DIR'])
+        except RestoreError as e:
+            return jsonify({"error": str(e)}), 400
+        prepare_schema(db.engine) # backups from older releases get the pending migrations
+        cache.invalidate('purchases', 'catalog', 'providers')
+        return jsonify({"message": "Database Restored successfully.", "previous": os.path.basename(saved)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/settings/backups')
+def list_db_backups():
+    try:
+        from backup import list_backups
+        return jsonify(list_backups(current_app.config['BACKUP_DIR']))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/settings/backups/<name>')
+def download_db_backup(name):
+    from flask import send_from_directory
+    from backup import PREFIX
+    if not name.startswith(PREFIX):
+        abort(404)
+    return send_from_directory(current_app.config['BACKUP_DIR'], name, as_attachment=True)
+
+@bp.route('/api/settings/download-log')
+def download_log():
+    try:
+        audit.flush() # include confirmations still in the writer queue
+        log_path = audit.path
+        if not os.path.exists(log_path):
+             return jsonify({"error": "No audit log found"}), 404
+        return send_file(log_path, as_attachment=True, download_name='audit_log' + os.path.splitext(log_path)[1])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/settings/upload-history', methods=['POST'])
+def upload_history():
+    # RESTORE LOGIC: Replay purchases from CSV
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    file = request.files['file']
+    
+    try:
+        # Streamed, chronological replay with bulk inserts (see history_replay.py)
+        from history_replay import replay_history
+        report = replay_history(file.stream)
+        db.session.commit()
+        cache.invalidate('purchases', 'catalog', 'providers')
+        return jsonify(report), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/settings/purge-data', methods=['POST'])
+def purge_data():
+    # SECURITY: This deletes transaction history
+    # Runs in the background in small batches (purge.py); poll the returned job
+    try:
+        data = request.json or {}
+        mode = data.get('mode') # 'transactions_only', 'full_wipe' or 'retention' (+ older_than_months)
+        from purge import start_purge
+        try:
+            job_id = start_purge(db.engine, mode, data.get('older_than_months'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 409
+        status_url = f"/api/settings/purge-data/{job_id}"
+        return jsonify({"message": "Purge started", "job_id": job_id, "status_url": status_url}), 202, {'Location': status_url}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/settings/purge-data/<int:job_id>', methods=['GET'])
+def purge_status(job_id):
+    from purge import get_job
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
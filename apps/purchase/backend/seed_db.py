@@ -1,102 +1,154 @@
 import csv
 import os
+import time
+from datetime import datetime
+from sqlalchemy import select, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from database import db
 from models import CatalogItem, Provider
+from provider_dedup import normalize_provider
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Points to ../data/items.csv relative to this backend script
 CSV_PATH = os.path.join(BASE_DIR, '..', 'data', 'items.csv')
 
+# Rows per INSERT ... ON CONFLICT statement (executemany batch)
+UPSERT_CHUNK = 500
+
+def parse_catalog_csv(target_path):
+    """
+    Stream-parse a Loyverse export.
+    Returns ({handle: item_row}, {normalized_provider: display_name}).
+    Duplicate handles: last row wins (same as sequential updates would).
+    """
+    items = {}
+    providers = {}
+
+    with open(target_path, mode='r', encoding='utf-8', newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            name = (row.get('Nombre') or '').strip()
+            if not name:
+                continue
+
+            try:
+                cost = float(row.get('Coste', 0.0))
+            except (TypeError, ValueError):
+                cost = 0.0
+
+            # Unit Logic
+            is_by_weight = (row.get('Vendido por peso') or 'N').upper() == 'Y'
+
+            handle = row.get('Handle', '')
+            items[handle] = {
+                "loyverse_id": handle,
+                "sku": row.get('SKU', ''),
+                "name": name[:199],
+                "category_id": row.get('Categoria', ''),
+                "current_cost": cost,
+                "default_unit": 'kg' if is_by_weight else 'und',
+                "is_by_weight": is_by_weight,
+            }
+
+            prov_name = (row.get('Proveedor') or '').strip()
+            if prov_name and prov_name.lower() != 'nan':
+                providers.setdefault(normalize_provider(prov_name), prov_name)
+
+    return items, providers
+
+def ingest_catalog(target_path):
+    """
+    Bulk catalog ingest: parse -> diff against preloaded state -> chunked upserts.
+    Existing items only get their unit fields refreshed (cost/name stay local).
+    Runs in the caller's transaction; commits at the end.
+    """
+    timings = {}
+
+    t0 = time.perf_counter()
+    items, providers = parse_catalog_csv(target_path)
+    timings['parse'] = time.perf_counter() - t0
+
+    # Diff: two queries total, whatever the file size
+    t0 = time.perf_counter()
+    existing = {
+        handle: (bool(by_weight), unit)
+        for handle, by_weight, unit in db.session.execute(
+            select(CatalogItem.loyverse_id, CatalogItem.is_by_weight, CatalogItem.default_unit)
+        )
+    }
+    known_providers = {
+        n for (n,) in db.session.execute(select(Provider.normalized_name)) if n
+    }
+
+    to_write = []
+    inserted = updated = unchanged = 0
+    for handle, row in items.items():
+        current = existing.get(handle)
+        if current is None:
+            inserted += 1
+        elif current != (row['is_by_weight'], row['default_unit']):
+            updated += 1
+        else:
+            unchanged += 1
+            continue
+        to_write.append(row)
+
+    new_providers = [
+        {"name": display.title(), "category": 'Scanner Import', "normalized_name": normalized}
+        for normalized, display in providers.items()
+        if normalized not in known_providers
+    ]
+    timings['diff'] = time.perf_counter() - t0
+
+    # Write: INSERT ... ON CONFLICT(loyverse_id) DO UPDATE, executemany per chunk
+    t0 = time.perf_counter()
+    if to_write:
+        stmt = sqlite_insert(CatalogItem.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['loyverse_id'],
+            set_={
+                "is_by_weight": stmt.excluded.is_by_weight,
+                "default_unit": stmt.excluded.default_unit,
+                "updated_at": datetime.utcnow(),
+            }
+        )
+        for i in range(0, len(to_write), UPSERT_CHUNK):
+            db.session.execute(stmt, to_write[i:i + UPSERT_CHUNK])
+
+    if new_providers:
+        db.session.execute(insert(Provider.__table__), new_providers)
+
+    db.session.commit()
+    timings['write'] = time.perf_counter() - t0
+
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unchanged,
+        "providers_added": len(new_providers),
+        "timings_ms": {phase: round(secs * 1000, 1) for phase, secs in timings.items()},
+    }
+
 def seed_catalog_from_path(csv_path_arg=None):
     target_path = csv_path_arg if csv_path_arg else CSV_PATH
     print(f"Reading CSV from: {target_path}")
-    
+
     if not os.path.exists(target_path):
         print("Error: CSV file not found.")
         return 0, 0
 
-    count = 0
-    new_providers_count = 0
-    
     try:
-        new_providers = set()
-        
-        # Ensure we are in transaction
-        # If run from script, we need explicit commit.
-        # If run from app route, session usage is fine, but we return counts.
-        
-        with open(target_path, mode='r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            
-            for row in reader:
-                name = row.get('Nombre', '').strip()
-                if not name:
-                    continue
-
-                handle = row.get('Handle', '')
-                sku = row.get('SKU', '') 
-                
-                try:
-                    cost = float(row.get('Coste', 0.0))
-                except ValueError:
-                    cost = 0.0
-                    
-                category_id = row.get('Categoria', '')
-                
-                # Unit Logic
-                sold_by_weight_str = row.get('Vendido por peso', 'N').upper()
-                is_by_weight = (sold_by_weight_str == 'Y')
-                default_unit = 'kg' if is_by_weight else 'und'
-
-                # Check existence by Loyverse ID (Handle)
-                existing = CatalogItem.query.filter_by(loyverse_id=handle).first()
-                if not existing:
-                    item = CatalogItem(
-                        loyverse_id=handle,
-                        sku=sku,
-                        name=name[:199],
-                        category_id=category_id,
-                        current_cost=cost,
-                        default_unit=default_unit,
-                        is_by_weight=is_by_weight
-                    )
-                    db.session.add(item)
-                    count += 1
-                else:
-                     existing.is_by_weight = is_by_weight
-                     existing.default_unit = default_unit
-                    
-                # Provider logic
-                prov_name = row.get('Proveedor', '').strip()
-                if prov_name and prov_name.lower() != 'nan':
-                    # Use normalized check if possible, or simple check
-                    # Models.py has normalized_name now.
-                    # We should probably normalize here too or update Provider model logic?
-                    # For seeding, let's keep it simple or align with new model.
-                    # Let's align.
-                    normalized = prov_name.lower().replace('.', '').replace(',', '').strip()
-                    existing_prov = Provider.query.filter_by(normalized_name=normalized).first()
-                    
-                    if not existing_prov:
-                         db.session.add(Provider(
-                             name=prov_name.title(), 
-                             category='Scanner Import',
-                             normalized_name=normalized
-                         ))
-                         new_providers_count += 1
-                            
-        db.session.commit()
-        return count, new_providers_count
-        
+        report = ingest_catalog(target_path)
+        print(f"Catalog ingest: {report}")
+        return report['inserted'], report['providers_added']
+
     except Exception as e:
         print(f"Error reading CSV: {e}")
         db.session.rollback()
         return 0, 0
 
 if __name__ == "__main__":
-    from app import app
-    with app.app_context():
-        print("Migrating Database...")
-        db.create_all()
-        seed_catalog_from_path()
+    # Same as: python manage.py seed
+    import sys
+    from manage import main
+    sys.exit(main(['seed'] + sys.argv[1:]))
@@ -0,0 +1,90 @@
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from database import db
+from models import Provider, Purchase, PurchaseLine
+from pagination import Keyset
+
+# Purchase serialization with a declared loading strategy.
+#
+# - Screens that need ORM objects (review page, single-purchase responses) load them
+#   with PURCHASE_LOAD_OPTIONS: provider joined in the same SELECT, lines in one
+#   extra SELECT ... WHERE purchase_id IN (...).
+# - List endpoints skip the ORM entirely: purchase_dicts() runs exactly two queries
+#   (headers + lines) and builds the Purchase.to_dict() shape from row tuples.
+#
+# Either way the query count per request is constant, not 1 + 2N.
+
+PURCHASE_LOAD_OPTIONS = (
+    joinedload(Purchase.provider),
+    selectinload(Purchase.lines),
+)
+
+IN_CHUNK = 900
+
+# Lists of purchases page newest first (drafts, provider history, exports)
+PURCHASES_NEWEST_FIRST = Keyset(Purchase.date, Purchase.id, descending=True)
+
+def purchase_key(purchase):
+    # Keyset values of a purchase_dicts() row
+    return datetime.fromisoformat(purchase['date']), purchase['id']
+
+_HEADER_COLUMNS = (
+    Purchase.id, Purchase.provider_id, Provider.name, Purchase.date,
+    Purchase.total_amount, Purchase.invoice_number, Purchase.notes, Purchase.status
+)
+
+_LINE_COLUMNS = (
+    PurchaseLine.purchase_id, PurchaseLine.id, PurchaseLine.catalog_item_id, PurchaseLine.catalog_item_name,
+    PurchaseLine.quantity, PurchaseLine.unit_cost, PurchaseLine.total_cost,
+    PurchaseLine.is_new_item, PurchaseLine.temp_category
+)
+
+def purchases_query(*criteria):
+    # Base statement for purchase_dicts(): add .where/.order_by/.limit as needed
+    return select(Purchase).where(*criteria)
+
+def purchase_dicts(stmt, with_lines=True):
+    """
+    stmt: select(Purchase) with filters / ordering / limit.
+    Returns a list of dicts identical to Purchase.to_dict(), in stmt order.
+    """
+    header_stmt = stmt.with_only_columns(*_HEADER_COLUMNS).\
+        outerjoin(Provider, Purchase.provider_id == Provider.id)
+
+    purchases = []
+    by_id = {}
+    for pid, provider_id, provider_name, date, total, invoice, notes, status in db.session.execute(header_stmt):
+        row = {
+            'id': pid,
+            'provider_id': provider_id,
+            'provider_name': provider_name if provider_name is not None else "Unknown",
+            'date': date.isoformat(),
+            'total_amount': total,
+            'invoice_number': invoice,
+            'notes': notes,
+            'status': status,
+            'lines': []
+        }
+        purchases.append(row)
+        by_id[pid] = row
+
+    if with_lines and by_id:
+        ids = list(by_id)
+        for i in range(0, len(ids), IN_CHUNK):
+            line_stmt = select(*_LINE_COLUMNS).\
+                where(PurchaseLine.purchase_id.in_(ids[i:i + IN_CHUNK])).\
+                order_by(PurchaseLine.purchase_id, PurchaseLine.id)
+            for purchase_id, lid, item_id, item_name, qty, unit_cost, total_cost, is_new, temp_cat in db.session.execute(line_stmt):
+                by_id[purchase_id]['lines'].append({
+                    'id': lid,
+                    'catalog_item_id': item_id,
+                    'catalog_item_name': item_name,
+                    'quantity': qty,
+                    'unit_cost': unit_cost,
+                    'total_cost': total_cost,
+                    'is_new_item': is_new,
+                    'temp_category': temp_cat
+                })
+
+    return purchases
@@ -1,18 +1,19 @@
 import random
 from datetime import datetime, timedelta
-from app import app
+from app import create_app
 from database import db
 from models import Provider, CatalogItem, Purchase, PurchaseLine, CostHistory
+from provider_dedup import normalize_provider
 
-def simulate():
-    with app.app_context():
+def simulate(app=None):
+    with (app or create_app(web=False)).app_context():
         print("🚀 Starting Data Simulation...")
         
         # 1. Ensure Providers exist
         provider_names = ["Distribuidora Macro", "Mercado Libre", "Abasto Local", "Sysco Import", "La Granja"]
         providers = []
         for name in provider_names:
-            norm = name.lower().replace('.', '').strip()
+            norm = normalize_provider(name)
             p = Provider.query.filter_by(normalized_name=norm).first()
             if not p:
                 p = Provider(name=name, normalized_name=norm, category="Simulated")
@@ -131,4 +132,7 @@ def simulate():
         print("✅ Simulation Complete. created 30 confirmed purchases and 1 draft.")
 
 if __name__ == "__main__":
-    simulate()
+    # Same as: python manage.py simulate
+    import sys
+    from manage import main
+    sys.exit(main(['simulate']))
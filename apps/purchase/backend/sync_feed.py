@@ -0,0 +1,164 @@
+import uuid
+from sqlalchemy import select, text
+from database import db
+from models import Provider, CatalogItem, Purchase
+
+# Change feed for offline clients (GET /api/sync/changes?since=<cursor>).
+#
+# - change_log holds ONE row per changed entity: (version, entity, entity_id, op).
+#   SQLite triggers on providers, catalog_items, purchases and purchase_lines write it
+#   with INSERT OR REPLACE, so every write (ORM, bulk upserts, purge, raw SQL) gets a
+#   new AUTOINCREMENT version and the log never grows past the number of entities
+#   plus tombstones.
+# - A line change is a change of its purchase (clients store purchases with lines).
+# - Cursors are "<epoch>-<version>". The epoch is random per database and a restore
+#   (restore, upload-db) writes a new one, even for a backup of this same database
+#   whose versions would otherwise be handed out again. A cursor from another epoch,
+#   from the future or older than the last tombstone prune gets reset=true and a full
+#   feed; the client drops its copy first.
+# - Rows are read after the log page. A row changed in between is sent in its newer
+#   state and again on the next sync (upserts are idempotent); a row deleted in
+#   between is skipped, its tombstone comes next.
+
+ENTITIES = {
+    # feed name -> (table, model)
+    'providers': ('providers', Provider),
+    'catalog': ('catalog_items', CatalogItem),
+    'purchases': ('purchases', Purchase),
+}
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 900 # one IN query per entity
+
+def _row_triggers(table, entity):
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table} BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, op) VALUES ('{entity}', new.id, 'upsert');
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_changes_au AFTER UPDATE ON {table} BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, op) VALUES ('{entity}', new.id, 'upsert');
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table} BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, op) VALUES ('{entity}', old.id, 'delete');
+        END""",
+    ]
+
+_DDL = [
+    """CREATE TABLE IF NOT EXISTS change_log (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity VARCHAR(20) NOT NULL,
+        entity_id INTEGER NOT NULL,
+        op VARCHAR(10) NOT NULL,
+        changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (entity, entity_id)
+    )""",
+    "CREATE TABLE IF NOT EXISTS sync_meta (key VARCHAR(50) PRIMARY KEY, value VARCHAR(100))",
+]
+for _entity, (_table, _) in ENTITIES.items():
+    _DDL += _row_triggers(_table, _entity)
+for _event, _ref in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+    # Line writes touch their purchase, unless the purchase itself is gone (tombstone wins)
+    _DDL.append(f"""CREATE TRIGGER IF NOT EXISTS purchase_lines_changes_a{_event[0].lower()} AFTER {_event} ON purchase_lines BEGIN
+        INSERT OR REPLACE INTO change_log (entity, entity_id, op)
+        SELECT 'purchases', {_ref}.purchase_id, 'upsert' WHERE EXISTS (SELECT 1 FROM purchases WHERE id = {_ref}.purchase_id);
+    END""")
+
+def ensure_change_log(engine):
+    """Create the log, meta and triggers if missing. Backfills on first creation."""
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='change_log'")
+        ).first()
+        for stmt in _DDL:
+            conn.execute(text(stmt))
+        if not exists:
+            for entity, (table, _) in ENTITIES.items():
+                conn.execute(text(
+                    f"INSERT OR REPLACE INTO change_log (entity, entity_id, op) SELECT '{entity}', id, 'upsert' FROM {table} ORDER BY id"
+                ))
+        conn.execute(
+            text("INSERT OR IGNORE INTO sync_meta (key, value) VALUES ('epoch', :epoch), ('pruned_version', '0')"),
+            {"epoch": new_epoch()}
+        )
+
+def new_epoch():
+    return uuid.uuid4().hex[:8]
+
+def parse_cursor(cursor):
+    """'<epoch>-<version>' -> (epoch, version). None/'' -> (None, 0). Raises ValueError."""
+    if not cursor:
+        return None, 0
+    epoch, _, version = cursor.rpartition('-')
+    if not epoch:
+        raise ValueError("Invalid cursor")
+    return epoch, int(version)
+
+def _serialize(entity, ids):
+    if entity == 'purchases':
+        from serializers import purchases_query, purchase_dicts
+        return purchase_dicts(purchases_query(Purchase.id.in_(ids)).order_by(Purchase.id))
+    model = ENTITIES[entity][1]
+    return [row.to_dict() for row in db.session.execute(
+        select(model).where(model.id.in_(ids)).order_by(model.id)
+    ).scalars()]
+
+def changes_since(cursor=None, entities=None, limit=DEFAULT_LIMIT):
+    """
+    One page of the feed: changes with version > cursor, oldest first.
+    Returns {cursor, has_more, reset, <entity>: {upserts: [...], deleted: [ids]}}.
+    """
+    entities = list(entities or ENTITIES)
+    unknown = [e for e in entities if e not in ENTITIES]
+    if unknown:
+        raise ValueError(f"Unknown entities: {', '.join(unknown)}. Options: {', '.join(ENTITIES)}")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    epoch, since = parse_cursor(cursor)
+
+    meta = dict(db.session.execute(text(
+        "SELECT key, value FROM sync_meta UNION ALL SELECT 'max_version', COALESCE(MAX(version), 0) FROM change_log"
+    )).all())
+    current_epoch, pruned, latest = meta['epoch'], int(meta['pruned_version']), int(meta['max_version'])
+    reset = epoch is not None and (epoch != current_epoch or since > latest or since < pruned)
+    if reset or epoch is None:
+        since = 0
+
+    params = {"since": since, "limit": limit + 1}
+    entity_params = {f"e{n}": e for n, e in enumerate(entities)}
+    params.update(entity_params)
+    page = db.session.execute(text(
+        f"SELECT version, entity, entity_id, op FROM change_log "
+        f"WHERE version > :since AND entity IN ({', '.join(':' + k for k in entity_params)}) "
+        f"ORDER BY version LIMIT :limit"
+    ), params).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    result = {
+        "cursor": f"{current_epoch}-{page[-1].version if page else since}",
+        "has_more": has_more,
+        "reset": reset,
+    }
+    for entity in entities:
+        upserts = [row.entity_id for row in page if row.entity == entity and row.op == 'upsert']
+        result[entity] = {
+            "upserts": _serialize(entity, upserts) if upserts else [],
+            "deleted": [row.entity_id for row in page if row.entity == entity and row.op == 'delete']
+        }
+    return result
+
+def prune_tombstones(older_than_days=90):
+    """Drop old tombstones; clients with a cursor from before them get a reset."""
+    pruned = db.session.execute(text(
+        "DELETE FROM change_log WHERE op = 'delete' AND changed_at < datetime('now', :age) RETURNING version"
+    ), {"age": f"-{int(older_than_days)} days"}).scalars().all()
+    if pruned:
+        db.session.execute(text(
+            "UPDATE sync_meta SET value = MAX(CAST(value AS INTEGER), :version) WHERE key = 'pruned_version'"
+        ), {"version": max(pruned)})
+    db.session.commit()
+    return len(pruned)
+
+if __name__ == "__main__":
+    # Same as: python manage.py prune-sync
+    import sys
+    from manage import main
+    sys.exit(main(['prune-sync'] + sys.argv[1:]))
@@ -0,0 +1,138 @@
+"""
+Verify: list endpoints run a constant number of SQL queries.
+
+Counts the statements each endpoint executes on a small history, grows the
+history 10x and counts again. Any growth (an N+1 sneaking back through a lazy
+relationship) or a count over the budget fails. Also checks that a draft write
+leaves the price series alone (reviewing right after one must not rebuild it)
+and that deleting a cloned draft keeps the pending items its clone still uses.
+
+    python verify_query_counts.py        # exit code 1 on regressions
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+_tmpdir = tempfile.mkdtemp()
+os.environ['PURCHASE_DB_URI'] = 'sqlite:///' + os.path.join(_tmpdir, 'counts.db')
+os.environ['PURCHASE_PRICE_SERIES_DIR'] = os.path.join(_tmpdir, 'price_series')
+
+from sqlalchemy import event, insert, select, func
+from app import app, cache
+from database import db
+from models import Provider, CatalogItem, Purchase, PurchaseLine
+from price_series import get_store
+
+# route -> max queries per request
+BUDGETS = {
+    '/api/purchases/recent': 2,
+    '/api/providers/1/history': 2,
+    '/drafts': 2,
+    '/api/analysis/top-providers': 1,
+    '/api/analysis/provider/1/top-items': 1,
+    '/api/sync/changes': 6,
+}
+
+def add_history(n_purchases, rnd):
+    item_count = db.session.execute(select(func.count(CatalogItem.id))).scalar()
+    start = datetime.utcnow() - timedelta(days=90)
+    first_id = (db.session.execute(select(func.max(Purchase.id))).scalar() or 0) + 1
+    db.session.execute(insert(Purchase), [
+        {"provider_id": rnd.randint(1, 3), "total_amount": 50.0,
+         "status": rnd.choice(['draft', 'confirmed']),
+         "date": start + timedelta(minutes=rnd.randint(0, 129600))}
+        for _ in range(n_purchases)
+    ])
+    db.session.execute(insert(PurchaseLine), [
+        {"purchase_id": pid, "catalog_item_id": rnd.randint(1, item_count), "catalog_item_name": "Item",
+         "quantity": 1, "unit_cost": 5.0, "total_cost": 5.0}
+        for pid in range(first_id, first_id + n_purchases) for _ in range(4)
+    ])
+    db.session.commit()
+
+def count_queries(route):
+    count = 0
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        nonlocal count
+        count += 1
+
+    cache.invalidate('purchases', 'catalog', 'providers') # measure the queries, not the cache
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        res = app.test_client().get(route)
+        if res.status_code >= 400:
+            raise RuntimeError(f"{route} returned {res.status_code}")
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return count
+
+def check_series_reuse():
+    # Drafts are not in the price series: reviewing one must reuse it (no build, no update)
+    client = app.test_client()
+    stats = get_store(app.config['PRICE_SERIES_DIR']).stats
+    body = {"provider_id": 1, "items": [{"catalog_item_id": 1, "quantity": 1, "unit_cost": 9.0, "total_cost": 9.0}]}
+
+    def review_after(write):
+        purchase_id = client.post('/api/purchases', json=body).get_json()['id']
+        if write:
+            write(purchase_id)
+        before = dict(stats)
+        res = client.get(f'/api/purchases/{purchase_id}/anomalies')
+        if res.status_code >= 400:
+            raise RuntimeError(f"anomalies returned {res.status_code}")
+        return {k: stats[k] - before[k] for k in ('builds', 'updates')}
+
+    review_after(None) # warm up
+    checks = [
+        ("review after a draft write", review_after(None), {"builds": 0, "updates": 0}),
+        ("review after a confirmation", review_after(lambda pid: client.post(f'/api/purchases/{pid}/confirm')),
+         {"builds": 0, "updates": 1}),
+    ]
+    failures = 0
+    for label, got, expected in checks:
+        ok = got == expected
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {label}  price series: {got} (expected {expected})")
+    return failures
+
+def check_delete_after_clone():
+    # create (with a pending item) -> clone -> delete the original: the clone keeps the item
+    client = app.test_client()
+    body = {"provider_id": 1, "items": [{"is_new_item": True, "catalog_item_name": "Ad hoc", "quantity": 1,
+                                         "unit_cost": 3.0, "total_cost": 3.0}]}
+    original = client.post('/api/purchases', json=body).get_json()['id']
+    item_id = client.post(f'/api/purchases/{original}/clone').get_json()['lines'][0]['catalog_item_id']
+    deleted = client.delete(f'/api/purchases/{original}')
+    kept = db.session.get(CatalogItem, item_id) is not None
+    ok = deleted.status_code == 200 and kept
+    print(f"{'OK  ' if ok else 'FAIL'} delete a cloned draft  status {deleted.status_code}, pending item kept: {kept}")
+    return 0 if ok else 1
+
+def main():
+    rnd = random.Random(3)
+    failures = 0
+    with app.app_context():
+        db.session.execute(insert(Provider), [{"name": f"Proveedor {i}", "normalized_name": f"proveedor {i}"} for i in range(3)])
+        db.session.execute(insert(CatalogItem), [{"loyverse_id": f"i-{i}", "name": f"Item {i}"} for i in range(50)])
+        db.session.commit()
+
+        add_history(10, rnd)
+        small = {route: count_queries(route) for route in BUDGETS}
+        add_history(100, rnd)
+        large = {route: count_queries(route) for route in BUDGETS}
+        series_failures = check_series_reuse() + check_delete_after_clone()
+
+    for route, budget in BUDGETS.items():
+        ok = small[route] == large[route] <= budget
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {route}  queries: {small[route]} -> {large[route]} (budget {budget})")
+
+    failures += series_failures
+    print("\nQuery counts are constant." if not failures else f"\n{failures} endpoint(s) regressed.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Verify: no full table scan on the hot query paths.
+
+Seeds a throwaway DB, calls each hot route through the Flask test client, captures
+every SQL statement it runs and checks its EXPLAIN QUERY PLAN. A plain
+"SCAN <table>" on a transactional table (no index) fails the check.
+
+    python verify_query_plans.py        # exit code 1 on regressions
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+_tmpdir = tempfile.mkdtemp()
+os.environ['PURCHASE_DB_URI'] = 'sqlite:///' + os.path.join(_tmpdir, 'plans.db')
+
+from sqlalchemy import event, text, insert
+from app import app
+from pagination import encode_cursor
+from database import db
+from models import Provider, CatalogItem, Purchase, PurchaseLine, CostHistory
+
+# Tables that grow with history: any unindexed scan on them is a regression
+GUARDED_TABLES = ('purchases', 'purchase_lines', 'cost_history', 'catalog_items', 'providers')
+
+def hot_routes(provider_id, item_id):
+    # Deep pages (keyset cursors halfway through the history) must seek, not scan
+    mid_date = datetime.utcnow() - timedelta(days=180)
+    return [
+        '/',
+        '/drafts',
+        f'/providers/{provider_id}',
+        f'/api/providers/{provider_id}/history',
+        '/api/analysis/top-providers',
+        f'/api/analysis/provider/{provider_id}/top-items',
+        f'/api/analysis/comparison/{item_id}',
+        f'/api/analysis/comparison?ids={item_id},{item_id + 1}',
+        '/api/catalog/monitor',
+        '/api/purchases/recent',
+        f'/drafts?cursor={encode_cursor((mid_date, 1500))}',
+        f'/api/providers/{provider_id}/history?cursor={encode_cursor((mid_date, 1500))}',
+        f'/api/catalog/monitor?cursor={encode_cursor((mid_date, 1500))}',
+        f'/api/catalog/monitor?cursor={encode_cursor((None, 1500))}',
+        f'/api/providers?cursor={encode_cursor(("Proveedor 2", 3))}',
+        '/api/export/purchases',
+    ]
+
+def seed(n_providers=40, n_items=3000, n_purchases=3000, lines_per_purchase=8):
+    rnd = random.Random(7)
+    db.session.execute(insert(Provider), [
+        {"name": f"Proveedor {i}", "normalized_name": f"proveedor {i}"} for i in range(n_providers)
+    ])
+    db.session.execute(insert(CatalogItem), [
+        {"loyverse_id": f"item-{i}", "sku": str(i), "name": f"Item {i}", "current_cost": 1.0 + i % 40}
+        for i in range(n_items)
+    ])
+    start = datetime.utcnow() - timedelta(days=365)
+    db.session.execute(insert(Purchase), [
+        {"provider_id": rnd.randint(1, n_providers), "total_amount": 100.0,
+         "status": 'draft' if rnd.random() < 0.05 else 'confirmed',
+         "date": start + timedelta(minutes=rnd.randint(0, 525600))}
+        for _ in range(n_purchases)
+    ])
+    lines = []
+    for purchase_id in range(1, n_purchases + 1):
+        for item_id in rnd.sample(range(1, n_items + 1), lines_per_purchase):
+            cost = rnd.uniform(1, 50)
+            lines.append({"purchase_id": purchase_id, "catalog_item_id": item_id, "catalog_item_name": f"Item {item_id}",
+                          "quantity": 1, "unit_cost": cost, "total_cost": cost})
+    db.session.execute(insert(PurchaseLine), lines)
+    db.session.execute(insert(CostHistory), [
+        {"catalog_item_id": rnd.randint(1, n_items), "provider_id": rnd.randint(1, n_providers),
+         "purchase_line_id": i + 1, "old_cost": 1, "new_cost": 2}
+        for i in range(0, len(lines), 3)
+    ])
+    db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+def capture_statements(route):
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            captured.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        res = app.test_client().get(route)
+        if res.status_code >= 400:
+            raise RuntimeError(f"{route} returned {res.status_code}")
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return captured
+
+def full_scans(plan_rows):
+    bad = []
+    for row in plan_rows:
+        detail = row[-1]
+        for table in GUARDED_TABLES:
+            if detail.startswith(f"SCAN {table}") and 'INDEX' not in detail:
+                bad.append(detail)
+    return bad
+
+def main():
+    failures = 0
+    with app.app_context():
+        seed()
+        provider_id, item_id = 1, 1
+
+        with db.engine.connect() as conn:
+            for route in hot_routes(provider_id, item_id):
+                statements = capture_statements(route)
+                route_bad = []
+                for statement, parameters in statements:
+                    plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+                    route_bad.extend(d for d in full_scans(plan) if d not in route_bad)
+                status = "OK  " if not route_bad else "FAIL"
+                print(f"{status} {route}  ({len(statements)} queries)")
+                for detail in route_bad:
+                    print(f"       {detail}")
+                failures += bool(route_bad)
+
+    print("\nAll hot paths use indexes." if not failures else f"\n{failures} route(s) with full scans.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())